@@ -0,0 +1,803 @@
+import argparse
+import ctypes
+import gc
+import hashlib
+import json
+import os
+import platform
+import re
+import tempfile
+import threading
+import time
+import tracemalloc
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from sqlalchemy import create_engine, text
+
+from data_cleaning import NON_DIGIT_PATTERN, VALIDATION_RULES, DataCleaning, to_arrow_strings
+from data_extraction import DataExtractor
+from database_utils import STAGED_TABLE_SUFFIX, DatabaseConnector
+from extraction_cache import ExtractionCache
+from instrumentation import resident_memory_bytes
+from sales_aggregates import SalesAggregator
+from output_sinks import ArrowSink, CsvSink, ParquetSink
+from sharded_cleaning import ShardedCleaner
+from synthetic_data import SOURCES
+
+# Directory of the Milestone 4 report queries
+MILESTONE_4_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Milestone_4')
+
+# Database used by the upload benchmarks. Set BENCHMARK_DB_URL to a PostgreSQL URL to include COPY.
+BENCHMARK_DB_URL = os.environ.get('BENCHMARK_DB_URL', 'sqlite://')
+
+
+def start_stub_store_api(number_of_stores: int, latency: float) -> ThreadingHTTPServer:
+    """
+    Starts a local HTTP server that mimics the store details API.
+
+    :param number_of_stores: Number of stores the stub serves; higher store numbers return 404.
+    :param latency: Artificial delay in seconds added to every response.
+    :return: The running server. Call shutdown() on it when done.
+    """
+    class StubStoreHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            time.sleep(latency)
+            store_number = int(self.path.rstrip('/').split('/')[-1])
+            if store_number >= number_of_stores:
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = json.dumps({
+                'index': store_number,
+                'store_code': f"ST-{store_number:05d}",
+                'staff_numbers': str(store_number % 100),
+                'country_code': 'GB'
+            }).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    class StubServer(ThreadingHTTPServer):
+        daemon_threads = True
+        request_queue_size = 128
+
+    server = StubServer(('127.0.0.1', 0), StubStoreHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_stub_file_server(content: bytes, latency: float) -> ThreadingHTTPServer:
+    """
+    Starts a local HTTP server that serves one file with an ETag and answers conditional
+    requests for the same ETag with 304 Not Modified.
+
+    :param content: Bytes served for every path.
+    :param latency: Artificial delay in seconds added to every response.
+    :return: The running server. Call shutdown() on it when done.
+    """
+    etag = f'"{hashlib.md5(content).hexdigest()}"'
+
+    class StubFileHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            time.sleep(latency)
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            pass
+
+    class StubServer(ThreadingHTTPServer):
+        daemon_threads = True
+
+    server = StubServer(('127.0.0.1', 0), StubFileHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def benchmark_store_fetch(number_of_stores: int = 200, latency: float = 0.02, max_workers: int = 16):
+    """
+    Compares sequential and concurrent store retrieval against a local stub API.
+
+    :param number_of_stores: Number of stores to fetch.
+    :param latency: Artificial per-request latency of the stub server in seconds.
+    :param max_workers: Number of concurrent requests for the concurrent run.
+    """
+    server = start_stub_store_api(number_of_stores, latency)
+    url = f"http://127.0.0.1:{server.server_address[1]}/store_details/{{store_number}}"
+    data_extractor = DataExtractor()
+    try:
+        start = time.perf_counter()
+        sequential_df = data_extractor.retrieve_stores_data(url, {}, number_of_stores)
+        sequential_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        concurrent_df = data_extractor.retrieve_stores_data(url, {}, number_of_stores, max_workers=max_workers)
+        concurrent_time = time.perf_counter() - start
+    finally:
+        server.shutdown()
+
+    pd.testing.assert_frame_equal(sequential_df, concurrent_df)
+    print(f"Store fetch ({number_of_stores} stores, {latency * 1000:.0f} ms latency)")
+    print(f"  sequential:             {sequential_time:.2f} s")
+    print(f"  concurrent ({max_workers} workers): {concurrent_time:.2f} s")
+    print(f"  speed-up:               {sequential_time / concurrent_time:.1f}x")
+
+
+def benchmark_upload(number_of_rows: int = 200000):
+    """
+    Compares upload throughput of DataFrame.to_sql and COPY on an orders-shaped DataFrame.
+
+    :param number_of_rows: Number of rows to upload.
+    """
+    orders_df = make_orders(0, number_of_rows, np.random.default_rng(0))
+    engine = create_engine(BENCHMARK_DB_URL)
+    db_connector = BenchmarkConnector(engine)
+
+    uploads = {'to_sql': lambda: db_connector.upload_to_db(orders_df, 'benchmark_orders', use_copy=False)}
+    if engine.dialect.name == 'postgresql':
+        uploads['copy'] = lambda: db_connector.upload_to_db(orders_df, 'benchmark_orders')
+    else:
+        print("COPY skipped: BENCHMARK_DB_URL is not a PostgreSQL database")
+
+    print(f"Upload ({number_of_rows} rows, {engine.dialect.name})")
+    for name, upload in uploads.items():
+        start = time.perf_counter()
+        upload()
+        elapsed = time.perf_counter() - start
+        print(f"  {name:7s} {elapsed:.2f} s, {number_of_rows / elapsed:,.0f} rows/s")
+    engine.dispose()
+
+
+class BenchmarkConnector(DatabaseConnector):
+    """DatabaseConnector that uses the benchmark database for both the source and the target."""
+    def __init__(self, engine):
+        super().__init__()
+        self.engine = engine
+
+    def get_engine(self, file_name: str):
+        return self.engine
+
+
+def make_orders(start_index: int, number_of_rows: int, rng: np.random.Generator) -> pd.DataFrame:
+    """
+    Creates an orders-shaped DataFrame with unique indexes and date_uuids.
+
+    :param start_index: First value of the 'index' column.
+    :param number_of_rows: Number of rows.
+    :param rng: Random generator for the other columns.
+    :return: DataFrame of synthetic orders.
+    """
+    indexes = np.arange(start_index, start_index + number_of_rows)
+    return pd.DataFrame({
+        'index': indexes,
+        'date_uuid': [f"{i:08x}-0000-4000-8000-000000000000" for i in indexes],
+        'card_number': rng.integers(10 ** 15, 10 ** 16, number_of_rows).astype(str),
+        'store_code': rng.choice(['WEB-1388012W', 'BL-8387506C', 'CH-01C8BD0C'], number_of_rows),
+        'product_code': rng.choice(['R7-3126933h', 'C2-7287916l', 'S7-1175877v'], number_of_rows),
+        'product_quantity': rng.integers(1, 20, number_of_rows)
+    })
+
+
+def legacy_convert_weight(weight):
+    """Row-at-a-time weight conversion that clean_product_data used before vectorization, kept as a baseline."""
+    weight = str(weight).lower().strip()
+    if 'x' in weight:
+        parts = weight.split('x')
+        if len(parts) == 2:
+            try:
+                quantity = int(parts[0].strip())
+                unit_weight = re.sub(r'[^\d.]', '', parts[1].strip())
+                if 'kg' in parts[1]:
+                    return quantity * float(unit_weight)
+                elif 'g' in parts[1]:
+                    return quantity * float(unit_weight) / 1000
+                elif 'ml' in parts[1]:
+                    return quantity * float(unit_weight) / 1000
+            except ValueError:
+                return 0
+        return 0
+    if 'kg' in weight:
+        return float(weight.replace('kg', '').strip().rstrip('.'))
+    elif 'g' in weight:
+        return float(weight.replace('g', '').strip().rstrip('.')) / 1000
+    elif 'ml' in weight:
+        return float(weight.replace('ml', '').strip().rstrip('.')) / 1000
+    else:
+        clean_weight = re.sub(r'[^\d.]+', '', weight).rstrip('.')
+        return float(clean_weight) / 1000 if clean_weight else 0
+
+
+def benchmark_weight_parsing(number_of_rows: int = 2000000):
+    """
+    Compares the per-row weight conversion baseline with the vectorized DataCleaning parser.
+
+    :param number_of_rows: Number of synthetic weight strings to convert.
+    """
+    rng = np.random.default_rng(0)
+    templates = np.array(['{}kg', '{}g', '{}ml', '12 x {}g', '{}g .', '{}'])
+    amounts = rng.integers(1, 1000, number_of_rows).astype(str)
+    chosen = templates[rng.integers(0, len(templates), number_of_rows)]
+    weights = pd.Series([template.format(amount) for template, amount in zip(chosen, amounts)], dtype=object)
+
+    start = time.perf_counter()
+    expected = weights.apply(legacy_convert_weight)
+    per_row_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = DataCleaning()._convert_weights(weights)
+    vectorized_time = time.perf_counter() - start
+
+    np.testing.assert_allclose(result.to_numpy(), expected.to_numpy(dtype=float))
+    print(f"Weight parsing ({number_of_rows} rows)")
+    print(f"  per-row apply: {per_row_time:.2f} s, {per_row_time / number_of_rows * 1e9:.0f} ns/row")
+    print(f"  vectorized:    {vectorized_time:.2f} s, {vectorized_time / number_of_rows * 1e9:.0f} ns/row")
+
+
+def benchmark_validation(number_of_rows: int = 1000000):
+    """
+    Compares the per-row email, staff number and EAN checks the cleaners used before with the
+    vectorized validation rules of DataCleaning.
+
+    :param number_of_rows: Number of synthetic values per check.
+    """
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'email_address': rng.choice(['jane.doe@example.com', 'bad-address', 'a@b', 'x.y@mail.co.uk'], number_of_rows),
+        'staff_numbers': rng.choice(['34', 'J78', '3n9', '120', None], number_of_rows),
+        'EAN': rng.choice(['7425710935115', 'ZTPGBXFAP8', '12 34', None], number_of_rows),
+        'date_added': pd.Series([pd.NaT] * number_of_rows)
+    })
+    data_cleaning = DataCleaning()
+
+    checks = {
+        'email': (
+            lambda: df['email_address'].apply(lambda x: re.match(r'^\S+@\S+\.\S+$', x) is not None),
+            lambda: VALIDATION_RULES['user_valid_email'](df)),
+        'staff_numbers': (
+            lambda: df['staff_numbers'].apply(lambda x: re.sub(r'\D', '', str(x)) if pd.notna(x) else None),
+            lambda: to_arrow_strings(df['staff_numbers']).str.replace(NON_DIGIT_PATTERN, '', regex=True)),
+        'EAN': (
+            lambda: ~(df['date_added'].isna() & ~df['EAN'].apply(lambda x: str(x).isdigit())),
+            lambda: VALIDATION_RULES['product_dated_or_numeric_ean'](df))
+    }
+
+    print(f"Validation ({number_of_rows} rows)")
+    for name, (per_row, vectorized) in checks.items():
+        start = time.perf_counter()
+        expected = per_row()
+        per_row_time = time.perf_counter() - start
+        start = time.perf_counter()
+        result = vectorized()
+        vectorized_time = time.perf_counter() - start
+        # Compare as plain Python objects, with any kind of missing value as None
+        pd.testing.assert_series_equal(result.astype(object).where(result.notna(), None),
+                                       expected.astype(object).where(expected.notna(), None), check_names=False)
+        print(f"  {name:13s} per-row {per_row_time:.2f} s, vectorized {vectorized_time:.2f} s "
+              f"({per_row_time / vectorized_time:.1f}x)")
+
+    data_cleaning._validate(df, 'user_valid_email')
+    print(f"  rejected by user_valid_email: {data_cleaning.rejection_counts['user_valid_email']}")
+
+
+def benchmark_incremental_load(total_rows: int = 500000, delta_sizes: tuple = (1000, 10000, 100000)):
+    """
+    Compares a full reload of an orders table with watermark-based incremental loads of growing deltas.
+
+    Source and target tables both live in BENCHMARK_DB_URL.
+
+    :param total_rows: Number of rows in the source table before the deltas are added.
+    :param delta_sizes: Numbers of new source rows loaded by each incremental run.
+    """
+    rng = np.random.default_rng(0)
+    engine = create_engine(BENCHMARK_DB_URL)
+    db_connector = BenchmarkConnector(engine)
+    data_extractor = DataExtractor()
+    db_connector.upload_to_db(make_orders(0, total_rows, rng), 'benchmark_source')
+
+    # Full load: read everything and replace the target
+    start = time.perf_counter()
+    for batch_number, batch in enumerate(data_extractor.stream_rds_table(db_connector, 'benchmark_source')):
+        db_connector.upload_to_db(batch, 'benchmark_target', if_exists='replace' if batch_number == 0 else 'append')
+    full_time = time.perf_counter() - start
+    db_connector.upsert_to_db(make_orders(0, 0, rng), 'benchmark_target', ['index'])
+    db_connector.set_watermark('benchmark_source', total_rows - 1)
+
+    print(f"Incremental load ({total_rows} source rows, {engine.dialect.name})")
+    print(f"  full load:              {full_time:.2f} s")
+    next_index = total_rows
+    for delta_size in delta_sizes:
+        db_connector.upload_to_db(make_orders(next_index, delta_size, rng), 'benchmark_source', if_exists='append')
+        next_index += delta_size
+
+        start = time.perf_counter()
+        watermark = int(db_connector.get_watermark('benchmark_source'))
+        # Read the delta before merging: SQLite cannot write while a streaming read is open on the same database
+        batches = list(data_extractor.stream_rds_table(db_connector, 'benchmark_source', watermark_column='index', watermark=watermark))
+        for batch in batches:
+            db_connector.upsert_to_db(batch, 'benchmark_target', ['index'])
+            db_connector.set_watermark('benchmark_source', int(batch['index'].max()))
+        incremental_time = time.perf_counter() - start
+        print(f"  incremental, {delta_size:>7} new rows: {incremental_time:.2f} s")
+    engine.dispose()
+
+
+def benchmark_extraction_cache(number_of_rows: int = 200000, latency: float = 0.05):
+    """
+    Compares extracting a sale-dates style JSON file without a cache, into a cold cache, and from a
+    warm cache revalidated with a conditional request, using a local stub HTTP server.
+
+    :param number_of_rows: Number of records in the JSON file.
+    :param latency: Artificial per-request latency of the stub server in seconds.
+    """
+    rng = np.random.default_rng(0)
+    content = json.dumps({
+        'timestamp': {str(i): f"{rng.integers(0, 24):02d}:{rng.integers(0, 60):02d}:00" for i in range(number_of_rows)},
+        'month': {str(i): str(rng.integers(1, 13)) for i in range(number_of_rows)},
+        'year': {str(i): str(rng.integers(1992, 2023)) for i in range(number_of_rows)},
+        'date_uuid': {str(i): f"{i:08x}-0000-4000-8000-000000000000" for i in range(number_of_rows)}
+    }).encode()
+    server = start_stub_file_server(content, latency)
+    url = f"http://127.0.0.1:{server.server_address[1]}/date_details.json"
+
+    timings = {}
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cached_extractor = DataExtractor(ExtractionCache(cache_dir))
+            for name, data_extractor in [('no cache', DataExtractor()), ('cold cache', cached_extractor),
+                                         ('warm cache', cached_extractor)]:
+                start = time.perf_counter()
+                df = data_extractor.extract_json_from_url(url)
+                timings[name] = time.perf_counter() - start
+                if name == 'no cache':
+                    expected = df
+                else:
+                    pd.testing.assert_frame_equal(df, expected)
+    finally:
+        server.shutdown()
+
+    print(f"Extraction cache ({number_of_rows} JSON records, {len(content) / 1e6:.1f} MB, {latency * 1000:.0f} ms latency)")
+    for name, elapsed in timings.items():
+        print(f"  {name:10s} {elapsed:.2f} s")
+
+
+def make_products_csv(path: str, number_of_rows: int, rng: np.random.Generator):
+    """
+    Writes a products-shaped CSV file with the columns of the S3 products file.
+
+    :param path: Path of the CSV file.
+    :param number_of_rows: Number of rows.
+    :param rng: Random generator for the column values.
+    """
+    pd.DataFrame({
+        'product_name': rng.choice(['FurReal Dazzlin Dimples', 'Tiny Tears Baby', 'Wooden Train Set'], number_of_rows),
+        'product_price': [f"£{price:.2f}" for price in rng.uniform(1, 100, number_of_rows)],
+        'weight': rng.choice(['1.6kg', '590g', '12 x 100g', '400ml', '16oz', '77g .'], number_of_rows),
+        'category': rng.choice(['toys-and-games', 'sports-and-leisure', 'pets', 'homeware'], number_of_rows),
+        'EAN': rng.integers(10 ** 12, 10 ** 13, number_of_rows).astype(str),
+        'date_added': pd.Timestamp('2005-01-01') + pd.to_timedelta(rng.integers(0, 6000, number_of_rows), unit='D'),
+        'uuid': [f"{i:08x}-0000-4000-8000-000000000000" for i in range(number_of_rows)],
+        'removed': rng.choice(['Still_avaliable', 'Removed'], number_of_rows),
+        'product_code': rng.choice(['R7-3126933h', 'C2-7287916l', 'S7-1175877v'], number_of_rows)
+    }).to_csv(path)
+
+
+def benchmark_product_streaming(number_of_rows: int = 1000000, chunksize: int = 100000):
+    """
+    Compares time and peak memory of reading and cleaning the products CSV in one piece and in batches.
+
+    :param number_of_rows: Number of product rows.
+    :param chunksize: Number of rows per batch for the streamed run.
+    """
+    data_extractor = DataExtractor()
+    data_cleaning = DataCleaning()
+
+    def read_whole_file(path):
+        return len(data_cleaning.clean_product_data(pd.read_csv(path)))
+
+    def read_in_batches(path):
+        with open(path, 'rb') as stream:
+            return sum(len(data_cleaning.clean_product_data(batch))
+                       for batch in data_extractor.read_product_csv(stream, chunksize))
+
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        path = os.path.join(temporary_dir, 'products.csv')
+        make_products_csv(path, number_of_rows, np.random.default_rng(0))
+
+        print(f"Product ingestion ({number_of_rows} rows, batches of {chunksize})")
+        for name, run in [('whole file', read_whole_file), ('streamed', read_in_batches)]:
+            tracemalloc.start()
+            start = time.perf_counter()
+            rows = run(path)
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"  {name:10s} {elapsed:.2f} s, peak memory {peak / 1024 ** 2:,.0f} MiB, {rows} rows")
+
+
+def make_star_schema(number_of_orders: int, rng: np.random.Generator) -> dict:
+    """
+    Creates an orders table and dimension tables holding every key the orders reference.
+
+    :param number_of_orders: Number of orders.
+    :param rng: Random generator for the order columns.
+    :return: Dictionary of star schema table names and DataFrames.
+    """
+    orders_df = make_orders(0, number_of_orders, rng)
+    orders_df['user_uuid'] = [f"{i:08x}-0000-4000-8000-000000000001" for i in rng.integers(0, 10000, number_of_orders)]
+    timestamps = pd.Timestamp('1993-01-01') + pd.to_timedelta(rng.integers(0, 30 * 365 * 86400, number_of_orders), unit='s')
+    return {
+        'dim_users': pd.DataFrame({'user_uuid': orders_df['user_uuid'].unique()}),
+        'dim_card_details': pd.DataFrame({'card_number': orders_df['card_number'].unique()}),
+        'dim_store_details': make_stores(orders_df['store_code'].unique()),
+        'dim_products': pd.DataFrame({
+            'product_code': orders_df['product_code'].unique(),
+            'product_price': rng.uniform(1, 100, orders_df['product_code'].nunique()).round(2)
+        }),
+        'dim_date_times': pd.DataFrame({
+            'timestamp': timestamps,
+            'month': timestamps.month.astype(str),
+            'year': timestamps.year.astype(str),
+            'day': timestamps.day.astype(str),
+            'date_uuid': orders_df['date_uuid']
+        }),
+        'orders_table': orders_df
+    }
+
+
+def make_stores(store_codes) -> pd.DataFrame:
+    """
+    Creates store details for the store codes used by make_orders.
+
+    :param store_codes: Store codes to describe.
+    :return: DataFrame of synthetic store details.
+    """
+    store_types = {'WEB': 'Web Portal', 'BL': 'Local', 'CH': 'Super Store'}
+    country_codes = {'WEB': 'GB', 'BL': 'DE', 'CH': 'US'}
+    prefixes = [store_code.split('-')[0] for store_code in store_codes]
+    return pd.DataFrame({
+        'store_code': store_codes,
+        'store_type': [store_types[prefix] for prefix in prefixes],
+        'country_code': [country_codes[prefix] for prefix in prefixes]
+    })
+
+
+def benchmark_deferred_constraints(number_of_orders: int = 500000):
+    """
+    Compares loading the star schema into tables that already have their keys and indexes with
+    loading unindexed staging tables and building the keys and indexes afterwards.
+
+    :param number_of_orders: Number of orders.
+    """
+    tables = make_star_schema(number_of_orders, np.random.default_rng(0))
+    engine = create_engine(BENCHMARK_DB_URL)
+    db_connector = BenchmarkConnector(engine)
+
+    # Indexed load: create the keyed tables empty, then append the rows to them
+    for table_name, df in tables.items():
+        db_connector.upload_to_db(df.head(0), table_name, staged=True)
+    db_connector.publish_staged_tables(list(tables))
+    start = time.perf_counter()
+    for table_name, df in tables.items():
+        db_connector.upload_to_db(df, table_name, if_exists='append')
+    indexed_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for table_name, df in tables.items():
+        db_connector.upload_to_db(df, table_name, staged=True)
+    load_time = time.perf_counter() - start
+    start = time.perf_counter()
+    db_connector.publish_staged_tables(list(tables))
+    publish_time = time.perf_counter() - start
+    engine.dispose()
+
+    print(f"Star schema load ({number_of_orders} orders, {engine.dialect.name})")
+    print(f"  into indexed tables: {indexed_time:.2f} s")
+    print(f"  staged + publish:    {load_time + publish_time:.2f} s ({load_time:.2f} s load, {publish_time:.2f} s keys, indexes and swap)")
+
+
+def benchmark_sales_aggregates(number_of_orders: int = 1000000, new_orders: int = 10000):
+    """
+    Compares the Milestone 4 report queries on the star schema with the same reports answered from
+    the sales summary tables, and times a full and an incremental summary refresh. The reports use
+    PostgreSQL syntax, so BENCHMARK_DB_URL must be a PostgreSQL database.
+
+    :param number_of_orders: Number of orders in the star schema.
+    :param new_orders: Number of orders added before the incremental refresh.
+    """
+    engine = create_engine(BENCHMARK_DB_URL)
+    if engine.dialect.name != 'postgresql':
+        print("Sales aggregates skipped: BENCHMARK_DB_URL is not a PostgreSQL database")
+        return
+
+    rng = np.random.default_rng(0)
+    tables = make_star_schema(number_of_orders + new_orders, rng)
+    orders_df = tables['orders_table']
+    db_connector = BenchmarkConnector(engine)
+    tables['orders_table'] = orders_df.iloc[:number_of_orders]
+    for table_name, df in tables.items():
+        db_connector.upload_to_db(df, table_name, staged=True)
+    db_connector.publish_staged_tables(list(tables))
+
+    aggregator = SalesAggregator(db_connector)
+    start = time.perf_counter()
+    aggregator.refresh(full=True)
+    full_time = time.perf_counter() - start
+
+    db_connector.upload_to_db(orders_df.iloc[number_of_orders:], 'orders_table', if_exists='append')
+    start = time.perf_counter()
+    aggregator.refresh()
+    incremental_time = time.perf_counter() - start
+
+    print(f"Sales aggregates ({number_of_orders} orders + {new_orders} new)")
+    print(f"  full refresh:                  {full_time:.2f} s")
+    print(f"  incremental refresh:           {incremental_time:.2f} s")
+    for task in ['task_3', 'task_4', 'task_5', 'task_6', 'task_8', 'task_9']:
+        timings = {}
+        results = {}
+        for name, path in [('fact table', os.path.join(MILESTONE_4_DIR, f"{task}.sql")),
+                           ('summary', os.path.join(MILESTONE_4_DIR, 'aggregates', f"{task}.sql"))]:
+            with open(path) as file:
+                query = file.read()
+            start = time.perf_counter()
+            results[name] = pd.read_sql(text(query), engine)
+            timings[name] = time.perf_counter() - start
+        same = results['fact table'].round(6).astype(str).equals(results['summary'].round(6).astype(str))
+        print(f"  {task}: fact table {timings['fact table'] * 1000:8.1f} ms, summary {timings['summary'] * 1000:6.1f} ms, "
+              f"{'same result' if same else 'DIFFERENT RESULT'}")
+    engine.dispose()
+
+
+def benchmark_sharded_cleaning(number_of_rows: int = 2000000, worker_counts: tuple = (1, 2, 4, 8),
+                               sources: tuple = ('users', 'orders')):
+    """
+    Compares cleaning synthetic frames in one process with ShardedCleaner at several worker counts,
+    and checks that every sharded result is identical to the single-process one.
+
+    :param number_of_rows: Number of generated rows per source.
+    :param worker_counts: Numbers of worker processes to compare.
+    :param sources: Names of the sources in synthetic_data.SOURCES.
+    """
+    print(f"Sharded cleaning ({number_of_rows} rows, {os.cpu_count()} CPUs)")
+    for source in sources:
+        generate, clean_method, _ = SOURCES[source]
+        df = generate(number_of_rows, 0)
+        start = time.perf_counter()
+        expected = getattr(DataCleaning(), clean_method)(df.copy())
+        single_time = time.perf_counter() - start
+        print(f"  {source:11s} single process {single_time:6.2f} s")
+
+        for workers in worker_counts:
+            with ShardedCleaner(DataCleaning(), max_workers=workers, min_rows_per_shard=1) as sharded_cleaner:
+                # Start the worker processes before timing
+                sharded_cleaner.clean(clean_method, df.iloc[:workers * 10].copy())
+                start = time.perf_counter()
+                result = sharded_cleaner.clean(clean_method, df)
+                elapsed = time.perf_counter() - start
+            try:
+                pd.testing.assert_frame_equal(result, expected, check_exact=True)
+                same = 'identical'
+            except AssertionError:
+                same = 'DIFFERENT RESULT'
+            print(f"  {source:11s} {workers:2d} workers     {elapsed:6.2f} s, {single_time / elapsed:4.2f}x, {same}")
+
+
+def benchmark_output_formats(number_of_rows: int = 1000000, sources: tuple = ('users', 'orders', 'date_events')):
+    """
+    Compares the output sinks on cleaned synthetic data: write time, size on disk, time to read the
+    whole table and time to read one column. Orders and date events are partitioned by year.
+
+    :param number_of_rows: Number of generated rows per source.
+    :param sources: Names of the sources in synthetic_data.SOURCES.
+    """
+    data_cleaning = DataCleaning()
+    tables = {}
+    for source in sources:
+        generate, clean_method, _ = SOURCES[source]
+        tables[source] = getattr(data_cleaning, clean_method)(generate(number_of_rows, 0))
+    if 'orders' in tables and 'date_events' in tables:
+        years = tables['date_events'].drop_duplicates('date_uuid').set_index('date_uuid')['year']
+        tables['orders'] = tables['orders'].assign(year=tables['orders']['date_uuid'].map(years).astype('Int16'))
+    partition_by = {source: 'year' for source in tables if 'year' in tables[source].columns}
+
+    sinks = [
+        ('csv', CsvSink),
+        ('parquet zstd', partial(ParquetSink, compression='zstd')),
+        ('arrow zstd', partial(ArrowSink, compression='zstd')),
+        ('arrow', partial(ArrowSink, compression=None))
+    ]
+    print(f"Output formats ({number_of_rows} rows per source)")
+    for source, df in tables.items():
+        column = 'date_uuid' if 'date_uuid' in df.columns else df.columns[-1]
+        for name, make_sink in sinks:
+            with tempfile.TemporaryDirectory() as temporary_dir:
+                sink = make_sink(temporary_dir, partition_by=partition_by)
+                start = time.perf_counter()
+                size = sink.write(source, df)
+                write_time = time.perf_counter() - start
+                start = time.perf_counter()
+                rows = len(sink.read(source))
+                read_time = time.perf_counter() - start
+                start = time.perf_counter()
+                sink.read(source, columns=[column])
+                column_time = time.perf_counter() - start
+            print(f"  {source:11s} {name:12s} write {write_time:6.2f} s, {size / 1024 ** 2:8.1f} MiB, "
+                  f"read {read_time:6.2f} s, read '{column}' {column_time:6.2f} s, {rows} rows")
+
+
+class PeakMemory:
+    def __init__(self, interval: float = 0.01):
+        """
+        Context manager measuring the peak resident memory of the process while its block runs, above
+        the memory in use when it was entered. Unlike tracemalloc, sampling the resident set size
+        includes Arrow's buffers and does not slow the measured code down. Memory freed by earlier
+        stages is handed back to the operating system first, so it is not reused unseen.
+        Needs /proc (Linux); elsewhere peak_bytes stays None.
+
+        :param interval: Seconds between samples.
+        """
+        self.interval = interval
+        self.peak_bytes = None
+        self._stop = threading.Event()
+
+    @staticmethod
+    def _release_free_memory():
+        gc.collect()
+        pa.default_memory_pool().release_unused()
+        try:
+            ctypes.CDLL('libc.so.6').malloc_trim(0)
+        except (OSError, AttributeError):
+            pass
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self._peak = max(self._peak, resident_memory_bytes())
+
+    def __enter__(self):
+        self._enabled = resident_memory_bytes() is not None
+        if self._enabled:
+            self._release_free_memory()
+            self._baseline = self._peak = resident_memory_bytes()
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._enabled:
+            self._stop.set()
+            self._thread.join()
+            self.peak_bytes = max(self._peak, resident_memory_bytes()) - self._baseline
+
+
+def measure_stage(source: str, stage: str, rows_in: int, run) -> tuple:
+    """
+    Runs one stage of the suite and records its time, throughput and peak memory.
+
+    :param source: Name of the source in synthetic_data.SOURCES.
+    :param stage: Name of the stage, e.g. the cleaning method.
+    :param rows_in: Number of rows passed to the stage.
+    :param run: Function running the stage and returning its DataFrame or row count.
+    :return: Tuple of the stage's return value and its result record.
+    """
+    with PeakMemory() as memory:
+        start = time.perf_counter()
+        output = run()
+        elapsed = time.perf_counter() - start
+    record = {
+        'source': source,
+        'stage': stage,
+        'rows_in': rows_in,
+        'rows_out': output if isinstance(output, int) else len(output),
+        'seconds': round(elapsed, 4),
+        'rows_per_second': round(rows_in / elapsed) if elapsed else None,
+        'peak_memory_bytes': memory.peak_bytes
+    }
+    memory_text = 'n/a' if memory.peak_bytes is None else f"{memory.peak_bytes / 1024 ** 2:,.0f} MiB"
+    print(f"  {source:11s} {stage:22s} {elapsed:8.2f} s {record['rows_per_second'] or 0:>12,} rows/s {memory_text:>10s}")
+    return output, record
+
+
+def benchmark_suite(sizes: tuple = (10000, 1000000, 10000000), output_file: str = 'benchmark_results.json',
+                    seed: int = 0):
+    """
+    Times every DataCleaning.clean_* method and the upload of its result on seeded synthetic data
+    of each source, at each size, and saves the results as JSON so runs can be compared. Uploads go
+    to BENCHMARK_DB_URL, an in-memory SQLite database unless set to a local PostgreSQL database.
+    They load staging tables, as main.py does with DEFERRED_CONSTRAINTS, so existing star schema
+    tables are left untouched; the staging tables are dropped at the end.
+
+    :param sizes: Numbers of generated rows per source.
+    :param output_file: Path of the JSON results file.
+    :param seed: Seed of the synthetic data generators.
+    """
+    engine = create_engine(BENCHMARK_DB_URL)
+    db_connector = BenchmarkConnector(engine)
+    results = []
+    for size in sizes:
+        print(f"Benchmark suite ({size} rows per source, {engine.dialect.name})")
+        for source, (generate, clean_method, table_name) in SOURCES.items():
+            df = generate(size, seed)
+            data_cleaning = DataCleaning()
+            cleaned_df, record = measure_stage(source, clean_method, len(df),
+                                               lambda: getattr(data_cleaning, clean_method)(df))
+            record['rows_dropped'] = dict(data_cleaning.rejection_counts)
+            results.append(record)
+            del df
+            _, record = measure_stage(source, 'upload_to_db', len(cleaned_df),
+                                      lambda: db_connector.upload_to_db(cleaned_df, table_name, staged=True) or len(cleaned_df))
+            results.append(record)
+            del cleaned_df
+    with engine.begin() as connection:
+        for _, _, table_name in SOURCES.values():
+            connection.execute(text(f'DROP TABLE IF EXISTS "{table_name}{STAGED_TABLE_SUFFIX}"'))
+    engine.dispose()
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'database': engine.dialect.name,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'cpu_count': os.cpu_count(),
+        'seed': seed,
+        'sizes': list(sizes),
+        'results': results
+    }
+    with open(output_file, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Benchmark results saved to {output_file}")
+
+
+BENCHMARKS = {
+    'store_fetch': benchmark_store_fetch,
+    'upload': benchmark_upload,
+    'weight_parsing': benchmark_weight_parsing,
+    'validation': benchmark_validation,
+    'incremental_load': benchmark_incremental_load,
+    'extraction_cache': benchmark_extraction_cache,
+    'product_streaming': benchmark_product_streaming,
+    'deferred_constraints': benchmark_deferred_constraints,
+    'sales_aggregates': benchmark_sales_aggregates,
+    'sharded_cleaning': benchmark_sharded_cleaning,
+    'output_formats': benchmark_output_formats,
+    'suite': benchmark_suite,
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run pipeline benchmarks.")
+    parser.add_argument('benchmarks', nargs='*', help=f"Benchmarks to run (default: all). Choose from {list(BENCHMARKS)}.")
+    parser.add_argument('--sizes', type=int, nargs='+', help="Rows per source for the suite (default: 10000 1000000 10000000).")
+    parser.add_argument('--output', default='benchmark_results.json', help="JSON file the suite saves its results to.")
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"Unknown benchmarks: {sorted(unknown)}")
+    for name in args.benchmarks or BENCHMARKS:
+        if name == 'suite':
+            benchmark_suite(tuple(args.sizes) if args.sizes else (10000, 1000000, 10000000), args.output)
+        else:
+            BENCHMARKS[name]()
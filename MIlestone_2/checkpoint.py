@@ -0,0 +1,92 @@
+import json
+import os
+import threading
+import time
+from typing import Iterable, Optional
+
+import pandas as pd
+
+from output_sinks import write_parquet
+
+
+class Checkpointer:
+    def __init__(self, enabled: bool = False, steps: Optional[Iterable[str]] = None,
+                 output_dir: str = 'checkpoints', compression: str = 'zstd'):
+        """
+        Records intermediate DataFrames of the cleaning steps for debugging.
+
+        Disabled by default, in which case checkpoint() returns immediately. When enabled, every
+        checkpoint records its row count and the time since the previous checkpoint (or since the
+        clean call started), and the selected steps are also written to compressed Parquet files.
+        A step reached several times, e.g. once per streamed batch, gets one numbered file per time.
+
+        :param enabled: Whether checkpoints are recorded at all.
+        :param steps: Names of the steps to write to Parquet. None writes every step.
+        :param output_dir: Directory the Parquet snapshots and the report are written to.
+        :param compression: Parquet compression codec.
+        """
+        self.enabled = enabled
+        self.steps = set(steps) if steps is not None else None
+        self.output_dir = output_dir
+        self.compression = compression
+        self.records = []
+        # Cleaners may run concurrently in pipeline threads, so step times are tracked per thread
+        self._local = threading.local()
+        self._start_time = time.perf_counter()
+        self._records_lock = threading.Lock()
+        self._step_counts = {}
+
+    def start(self):
+        """
+        Marks the start of a clean call in the current thread, so its first step is timed from here.
+        """
+        if self.enabled:
+            self._local.last_time = time.perf_counter()
+
+    def checkpoint(self, df: pd.DataFrame, step: str):
+        """
+        Records a checkpoint for a cleaning step and writes a snapshot if the step is selected.
+
+        :param df: DataFrame as it is after the step.
+        :param step: Name of the step, e.g. 'product_dropped_all_na'.
+        """
+        if not self.enabled:
+            return
+
+        step_time = time.perf_counter() - getattr(self._local, 'last_time', self._start_time)
+        with self._records_lock:
+            sequence = self._step_counts.get(step, 0)
+            self._step_counts[step] = sequence + 1
+        record = {'step': step, 'sequence': sequence, 'rows': len(df), 'step_seconds': round(step_time, 6),
+                  'snapshot': None}
+
+        if self.steps is None or step in self.steps:
+            os.makedirs(self.output_dir, exist_ok=True)
+            file_name = os.path.join(self.output_dir, f"{step}_{sequence:04d}.parquet")
+            start = time.perf_counter()
+            write_parquet(df, file_name, compression=self.compression, index=False)
+            record['snapshot'] = file_name
+            record['write_seconds'] = round(time.perf_counter() - start, 6)
+            print(f"Checkpoint '{step}' saved: {file_name} ({len(df)} rows)")
+
+        with self._records_lock:
+            self.records.append(record)
+        # Don't count the snapshot write towards the next step's time
+        self._local.last_time = time.perf_counter()
+
+    def write_report(self, file_name: str = 'checkpoint_report.json'):
+        """
+        Writes the recorded row counts and timings to a JSON file in the output directory.
+
+        :param file_name: Name of the report file.
+        """
+        if not self.enabled:
+            return
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(os.path.join(self.output_dir, file_name), 'w') as file:
+            json.dump(self.records, file, indent=2)
+
+
+if __name__ == '__main__':
+    pass
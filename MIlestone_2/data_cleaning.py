@@ -1,9 +1,260 @@
+import numpy as np
 import pandas as pd
-import re
-import os
+import pyarrow as pa
+import pyarrow.compute as pc
+import json
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from checkpoint import Checkpointer
+
+
+# Weight units and their factor to kilograms, in the order they are matched:
+# a weight containing 'kg' is never read as grams.
+WEIGHT_UNITS = {
+    'kg': 1.0,
+    'g': 0.001,
+    'ml': 0.001,
+    'oz': 0.028349523125
+}
+
+# Upper bounds in kilograms of the product weight classes; heavier products are 'Truck_Required'
+WEIGHT_CLASSES = {
+    'Light': 2,
+    'Mid_Sized': 40,
+    'Heavy': 140
+}
+
+# Well-formed weights: an optional "N x" multipack quantity, a number, an optional unit and a stray trailing dot.
+# Patterns are kept as strings because Arrow's regex kernels take the pattern text, not a compiled re.Pattern.
+WEIGHT_PATTERN = r'^(?:\d+\s*x\s*)?\d+(?:\.\d+)?\s*(?:kg|g|ml|oz)?\s*\.?$'
+
+# The number part of a well-formed multipack weight, e.g. "12 x 100"
+MULTIPACK_WEIGHT_PATTERN = r'^(?P<quantity>\d+)\s*x\s*(?P<value>\d+(?:\.\d+)?)$'
+
+# Any "N x <unit weight>" multipack, used for weights WEIGHT_PATTERN does not match
+MULTIPACK_PATTERN = r'^\s*(\d+)\s*x([^x]*)$'
+
+# Card providers accepted in the card details
+VALID_CARD_PROVIDERS = [
+    "Discover", "VISA 13 digit", "VISA 16 digit", "VISA 19 digit",
+    "American Express", "Mastercard", "Maestro", "Diners Club / Carte Blanche",
+    "JCB 15 digit", "JCB 16 digit"
+]
+
+# Email addresses accepted by the user validation
+EMAIL_PATTERN = r'\S+@\S+\.\S+'
+
+# Characters removed from the staff numbers
+NON_DIGIT_PATTERN = r'\D'
+
+
+def to_arrow_strings(values: pd.Series) -> pd.Series:
+    """
+    Converts a Series to Arrow-backed strings, so its .str methods run in Arrow's C++ kernels
+    rather than calling Python for every row.
+
+    :param values: Series of strings; other values are converted with str(), missing values stay missing.
+    :return: Series of Arrow strings with the same index.
+    """
+    try:
+        text = pa.array(values, type=pa.string(), from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        text = pa.array(values.astype(str).where(values.notna()), type=pa.string(), from_pandas=True)
+    return pd.Series(pd.arrays.ArrowExtensionArray(text), index=values.index)
+
+
+# Row validation rules shared by the cleaners: each maps a DataFrame to a boolean Series of the rows
+# to keep. DataCleaning counts the rows each rule rejects in rejection_counts.
+VALIDATION_RULES = {
+    'user_valid_email': lambda df: to_arrow_strings(df['email_address']).str.fullmatch(EMAIL_PATTERN).fillna(False),
+    'card_valid_provider': lambda df: df['card_provider'].isin(VALID_CARD_PROVIDERS),
+    'store_has_opening_date': lambda df: df['opening_date'].notna(),
+    'store_valid_country_code': lambda df: df['country_code'].str.len() <= 2,
+    'store_not_null_store_code': lambda df: df['store_code'].str.upper() != 'NULL',
+    # Undated products are only kept if their EAN is numeric
+    'product_dated_or_numeric_ean': lambda df: (
+        df['date_added'].notna() | to_arrow_strings(df['EAN']).str.isdigit().fillna(False))
+}
+
+# Compact column types per cleaner, used when DataCleaning is created with compact_dtypes=True.
+# Low-cardinality text becomes categorical, other text (names, codes, UUIDs) Arrow-backed strings,
+# and numbers the narrowest type of their column in Full_M3_Script.sql (SMALLINT, REAL).
+ARROW_STRING = 'string[pyarrow]'
+COMPACT_SCHEMAS = {
+    'user': {
+        'first_name': ARROW_STRING, 'last_name': ARROW_STRING, 'company': ARROW_STRING,
+        'email_address': ARROW_STRING, 'address': ARROW_STRING, 'phone_number': ARROW_STRING,
+        'country': 'category', 'country_code': 'category', 'user_uuid': ARROW_STRING
+    },
+    'card': {
+        'card_number': ARROW_STRING, 'card_provider': 'category'
+    },
+    'store': {
+        'address': ARROW_STRING, 'locality': ARROW_STRING, 'store_code': ARROW_STRING,
+        'staff_numbers': 'Int16', 'store_type': 'category', 'country_code': 'category',
+        'continent': 'category', 'longitude': 'float32', 'latitude': 'float32'
+    },
+    'product': {
+        'product_name': ARROW_STRING, 'category': 'category', 'EAN': ARROW_STRING, 'uuid': ARROW_STRING,
+        'product_code': ARROW_STRING, 'weight_class': 'category'
+    },
+    'orders': {
+        'date_uuid': ARROW_STRING, 'user_uuid': ARROW_STRING, 'card_number': ARROW_STRING,
+        'store_code': ARROW_STRING, 'product_code': ARROW_STRING, 'product_quantity': 'Int16'
+    },
+    'date_events': {
+        'month': 'Int8', 'day': 'Int8', 'year': 'Int16', 'time_period': 'category', 'date_uuid': ARROW_STRING
+    }
+}
+
+# Cleaning methods that can run on row partitions of a frame (see sharded_cleaning.py): their name in
+# COMPACT_SCHEMAS and the columns they convert with _parse_dates, i.e. with an inferred date format
+CLEANERS = {
+    'clean_user_data': ('user', ['join_date', 'date_of_birth']),
+    'clean_card_data': ('card', ['date_payment_confirmed']),
+    'clean_store_data': ('store', ['opening_date']),
+    'clean_product_data': ('product', ['date_added']),
+    'clean_orders_data': ('orders', []),
+    'clean_date_events_data': ('date_events', [])
+}
 
 
 class DataCleaning:
+    def __init__(self, checkpointer: Optional[Checkpointer] = None, compact_dtypes: bool = False,
+                 date_formats: Optional[dict] = None):
+        """
+        Initializes the cleaner.
+
+        :param checkpointer: Checkpointer used to snapshot intermediate steps. Defaults to a disabled one.
+        :param compact_dtypes: Whether the cleaners convert their output to the compact types in
+            COMPACT_SCHEMAS, recording the memory saved in memory_report.
+        :param date_formats: Dictionary of date columns and the format to parse them with, instead of
+            the format pd.to_datetime infers from the first value. Used to clean row partitions of a
+            frame exactly as the whole frame would be.
+        """
+        self.checkpointer = checkpointer if checkpointer is not None else Checkpointer()
+        self.compact_dtypes = compact_dtypes
+        self.date_formats = date_formats or {}
+        self.memory_report = []
+        self.rejection_counts = {}
+        self._rejection_counts_lock = threading.Lock()
+        # Cleaners may run concurrently in pipeline threads, so tracked rejections are kept per thread
+        self._local = threading.local()
+
+    def _validate(self, df: pd.DataFrame, rule: str) -> pd.DataFrame:
+        """
+        Keeps the rows that pass a rule of VALIDATION_RULES and counts the rows it rejects.
+
+        :param df: DataFrame to validate.
+        :param rule: Name of the rule in VALIDATION_RULES.
+        :return: DataFrame of the valid rows.
+        """
+        valid = VALIDATION_RULES[rule](df).to_numpy(dtype=bool)
+        self.count_rejections(rule, int((~valid).sum()))
+        return df[valid]
+
+    def count_rejections(self, rule: str, rejected: int):
+        """
+        Adds rows rejected by a validation rule to rejection_counts and to the current thread's tracked rejections.
+
+        :param rule: Name of the rule in VALIDATION_RULES.
+        :param rejected: Number of rows the rule rejected.
+        """
+        with self._rejection_counts_lock:
+            self.rejection_counts[rule] = self.rejection_counts.get(rule, 0) + rejected
+        tracked = getattr(self._local, 'rejections', None)
+        if tracked is not None:
+            tracked[rule] = tracked.get(rule, 0) + rejected
+
+    @contextmanager
+    def track_rejections(self) -> Iterator[dict]:
+        """
+        Counts the rows each validation rule rejects in the current thread while the block runs,
+        e.g. to attribute dropped rows to one batch of one source.
+
+        :return: Dictionary of rule names and rejected rows, filled in as the block runs.
+        """
+        rejections = {}
+        self._local.rejections = rejections
+        try:
+            yield rejections
+        finally:
+            self._local.rejections = None
+
+    @contextmanager
+    def use_date_formats(self, date_formats: dict) -> Iterator[None]:
+        """
+        Parses date columns with the given formats in the current thread while the block runs, on
+        top of date_formats, e.g. to clean every batch of a streamed table with the same formats.
+
+        :param date_formats: Dictionary of date columns and the format to parse them with.
+        """
+        self._local.date_formats = date_formats
+        try:
+            yield
+        finally:
+            self._local.date_formats = None
+
+    def _parse_dates(self, values: pd.Series) -> pd.Series:
+        """
+        Converts a column to datetime, with unparseable values as NaT. The format is taken from
+        the formats set with use_date_formats or date_formats if set for the column, otherwise
+        inferred by pd.to_datetime.
+
+        :param values: Series of date values, named after its column.
+        :return: Series of datetimes.
+        """
+        date_formats = {**self.date_formats, **(getattr(self._local, 'date_formats', None) or {})}
+        return pd.to_datetime(values, format=date_formats.get(values.name), errors='coerce')
+
+    def compact(self, df: pd.DataFrame, name: str) -> pd.DataFrame:
+        """
+        Converts the columns of a cleaned DataFrame to the compact types of its cleaner, if enabled,
+        and records the memory use before and after.
+
+        A column whose values do not fit its compact type (e.g. a fractional staff number) is left unchanged.
+
+        :param df: Cleaned DataFrame.
+        :param name: Name of the cleaner in COMPACT_SCHEMAS, e.g. 'store'.
+        :return: DataFrame with compact column types.
+        """
+        if not self.compact_dtypes:
+            return df
+
+        bytes_before = int(df.memory_usage(deep=True).sum())
+        df = df.copy()
+        for column, dtype in COMPACT_SCHEMAS[name].items():
+            if column not in df.columns:
+                continue
+            try:
+                if dtype == ARROW_STRING and not pd.api.types.is_string_dtype(df[column]):
+                    # Numbers read from the database (e.g. card numbers) are stored as their text
+                    df[column] = df[column].astype(str).where(df[column].notna())
+                df[column] = df[column].astype(dtype)
+            except (TypeError, ValueError) as e:
+                print(f"Could not convert {name} column '{column}' to {dtype}: {e}")
+        bytes_after = int(df.memory_usage(deep=True).sum())
+
+        self.memory_report.append({
+            'cleaner': name, 'rows': len(df), 'bytes_before': bytes_before, 'bytes_after': bytes_after
+        })
+        print(f"Compacted {name} data: {bytes_before / 1024 ** 2:.1f} MiB -> {bytes_after / 1024 ** 2:.1f} MiB")
+        return df
+
+    def write_memory_report(self, file_name: str = 'memory_report.json'):
+        """
+        Writes the memory use recorded by the compact mode to a JSON file.
+
+        :param file_name: Path of the report file.
+        """
+        if not self.memory_report:
+            return
+
+        with open(file_name, 'w') as file:
+            json.dump(self.memory_report, file, indent=2)
+
     def clean_user_data(self, df: pd.DataFrame) -> pd.DataFrame:
         """
         Cleans user data DataFrame by handling missing values and formatting issues.
@@ -11,13 +262,14 @@ class DataCleaning:
         :param df: DataFrame containing user data.
         :return: Cleaned DataFrame.
         """
+        self.checkpointer.start()
+
         # Drop rows where all elements are NaN
         df = df.dropna(how='all')
 
         # Convert date columns to datetime format
-        df['join_date'] = pd.to_datetime(df['join_date'], errors='coerce')
-        df['date_of_birth'] = pd.to_datetime(
-            df['date_of_birth'], errors='coerce')
+        df['join_date'] = self._parse_dates(df['join_date'])
+        df['date_of_birth'] = self._parse_dates(df['date_of_birth'])
 
         # Standardize string formats
         df['country_code'] = df['country_code'].str.upper()
@@ -31,10 +283,10 @@ class DataCleaning:
         df['email_address'] = df['email_address'].str.strip().str.lower()
 
         # Validate email addresses
-        df = df[df['email_address'].apply(
-            lambda x: re.match(r'^\S+@\S+\.\S+$', x) is not None)]
+        df = self._validate(df, 'user_valid_email')
+        self.checkpointer.checkpoint(df, 'user_cleaned')
 
-        return df
+        return self.compact(df, 'user')
 
     def clean_card_data(self, df: pd.DataFrame) -> pd.DataFrame:
         """
@@ -43,18 +295,19 @@ class DataCleaning:
         :param df: DataFrame containing card data.
         :return: Cleaned DataFrame.
         """
-        # Save the original data to a CSV file for reference
-        df.to_csv("og_card_data.csv", index=False)
+        self.checkpointer.start()
+
+        # Checkpoint the original data for reference
+        self.checkpointer.checkpoint(df, 'card_original')
 
         # Ensure 'card_number' contains only digit strings and non-null values
         df['card_number'] = df['card_number'].astype(
             str).str.strip().str.replace('?', '', regex=False)
-        # consider saving another csv after each operation to check how they impact the data. 
-        # df.to_csv("_.csv", index=False)
+        self.checkpointer.checkpoint(df, 'card_cleaned_card_number')
 
         # Convert date columns to datetime format
         df['expiry_date'] = pd.to_datetime(df['expiry_date'], format='%m/%y', errors='coerce')
-        df['date_payment_confirmed'] = pd.to_datetime(df['date_payment_confirmed'], errors='coerce')
+        df['date_payment_confirmed'] = self._parse_dates(df['date_payment_confirmed'])
 
         # Convert non-critical object columns to numeric, where applicable
         for column in df.columns:
@@ -62,17 +315,13 @@ class DataCleaning:
                 df[column] = pd.to_numeric(df[column], errors='coerce')
 
         # Filter valid card providers
-        valid_card_providers = [
-            "Discover", "VISA 13 digit", "VISA 16 digit", "VISA 19 digit",
-            "American Express", "Mastercard", "Maestro", "Diners Club / Carte Blanche",
-            "JCB 15 digit", "JCB 16 digit"
-        ]
-        df = df[df['card_provider'].isin(valid_card_providers)]
+        df = self._validate(df, 'card_valid_provider')
 
         # Drop rows where all values are missing
         df.dropna(how='all', inplace=True)
+        self.checkpointer.checkpoint(df, 'card_cleaned')
 
-        return df
+        return self.compact(df, 'card')
 
     def clean_store_data(self, df: pd.DataFrame) -> pd.DataFrame:
         """
@@ -81,6 +330,8 @@ class DataCleaning:
         :param df: DataFrame containing store data.
         :return: Cleaned DataFrame.
         """
+        self.checkpointer.start()
+
         # Convert all column headers to lowercase
         df.columns = df.columns.str.lower()
 
@@ -92,15 +343,14 @@ class DataCleaning:
         df = df.dropna(how='all')
 
         # Clean 'staff_numbers' by stripping non-numeric characters
-        df['staff_numbers'] = df['staff_numbers'].apply(
-            lambda x: re.sub(r'\D', '', str(x)) if pd.notna(x) else None)
+        df['staff_numbers'] = to_arrow_strings(df['staff_numbers']).str.replace(NON_DIGIT_PATTERN, '', regex=True)
 
         # Drop rows with NaN in 'opening_date' column
-        df = df.dropna(subset=['opening_date'])
+        df = self._validate(df, 'store_has_opening_date')
 
         # Convert columns to appropriate formats
-        df['staff_numbers'] = pd.to_numeric(df['staff_numbers'], errors='coerce')
-        df['opening_date'] = pd.to_datetime(df['opening_date'], errors='coerce')
+        df['staff_numbers'] = pd.to_numeric(df['staff_numbers'], errors='coerce').astype('Int64')
+        df['opening_date'] = self._parse_dates(df['opening_date'])
         df['longitude'] = pd.to_numeric(df['longitude'], errors='coerce')
         df['latitude'] = pd.to_numeric(df['latitude'], errors='coerce')
 
@@ -110,12 +360,17 @@ class DataCleaning:
         # Clean 'address' and 'country_code'
         df['address'] = df['address'].str.title()
         df['country_code'] = df['country_code'].str.upper()
-        df = df[df['country_code'].str.len() <= 2]
+        df = self._validate(df, 'store_valid_country_code')
 
         # Drop rows where store_code is the string "NULL"
-        df = df[df['store_code'].str.upper() != 'NULL']
+        df = self._validate(df, 'store_not_null_store_code')
 
-        return df
+        # The web portal (index 0) has no physical location
+        if 'index' in df.columns:
+            df.loc[df['index'] == 0, ['longitude', 'latitude', 'address', 'locality']] = None
+        self.checkpointer.checkpoint(df, 'store_cleaned')
+
+        return self.compact(df, 'store')
 
     def clean_product_data(self, df: pd.DataFrame) -> pd.DataFrame:
         """
@@ -123,70 +378,141 @@ class DataCleaning:
 
         This method processes the 'weight' column in the provided DataFrame to ensure all weights
         are represented in kilograms. It handles weights given in various units such as kg, g, and ml.
+        Prices are converted to numbers, and the 'weight_class' and 'still_available' columns of
+        dim_products are derived here rather than in the Milestone 3 SQL script.
 
         # I had to return to this section to make several fixes to the cleaning operations -
         # - as I was returning errors when running my SQL scripts.
-        # This is why i defined a 'save_and_log' helper function to just save after every operation to identify problem lines in my code.
+        # Each operation is checkpointed so problem lines can be identified by enabling the Checkpointer.
 
         :param df: DataFrame containing product data with a 'weight' column.
-        :return: DataFrame with weights converted to kilograms as float.
+        :return: DataFrame with weights in kilograms, numeric prices, 'weight_class' and 'still_available'.
         """
-        def save_and_log(df, filename, step_description):
-            df.to_csv(filename, index=False)
-            if os.path.exists(filename):
-                print(f"{step_description} saved successfully: {filename}")
-            else:
-                print(f"Failed to save {step_description}: {filename}")
+        self.checkpointer.start()
 
-        save_and_log(df, "og_product_data.csv", "Original product data")
+        self.checkpointer.checkpoint(df, 'product_original')
 
         # Drop rows where all elements are NaN
         df = df.dropna(how='all')
-        save_and_log(df, "after_dropping_all_na.csv", "After dropping all NaN rows")
+        self.checkpointer.checkpoint(df, 'product_dropped_all_na')
 
         # Convert 'date_added' to datetime
-        df['date_added'] = pd.to_datetime(df['date_added'], errors='coerce')
-        save_and_log(df, "after_converting_date_added.csv", "After converting date_added to datetime")
+        df['date_added'] = self._parse_dates(df['date_added'])
+        self.checkpointer.checkpoint(df, 'product_converted_date_added')
 
         # Drop rows where 'date_added' is NaN but 'EAN' is non-numeric
-        df = df[~(df['date_added'].isna() & ~
-                  df['EAN'].apply(lambda x: str(x).isdigit()))]
-        save_and_log(df, "after_dropping_na_date_added_with_non_numeric_ean.csv", "After dropping NaN in date_added with non-numeric EAN")
-
-        def convert_weight(weight):
-            """Helper function to caluclate weight conversions in product data."""
-            weight = str(weight).lower().strip()
-            if 'x' in weight:
-                parts = weight.split('x')
-                if len(parts) == 2:
-                    try:
-                        quantity = int(parts[0].strip())
-                        unit_weight = re.sub(r'[^\d.]', '', parts[1].strip())
-                        if 'kg' in parts[1]:
-                            return quantity * float(unit_weight)
-                        elif 'g' in parts[1]:
-                            return quantity * float(unit_weight) / 1000
-                        elif 'ml' in parts[1]:
-                            return quantity * float(unit_weight) / 1000
-                    except ValueError:
-                        return 0
-                return 0
-            if 'kg' in weight:
-                return float(weight.replace('kg', '').strip().rstrip('.'))
-            elif 'g' in weight:
-                return float(weight.replace('g', '').strip().rstrip('.')) / 1000
-            elif 'ml' in weight:
-                return float(weight.replace('ml', '').strip().rstrip('.')) / 1000
-            else:
-                clean_weight = re.sub(r'[^\d.]+', '', weight).rstrip('.')
-                return float(clean_weight) / 1000 if clean_weight else 0
-
-        # Apply the conversion function and handle non-numeric weights
-        df['weight'] = df['weight'].apply(
-            lambda x: convert_weight(x) if isinstance(x, str) else 0)
-        save_and_log(df, "after_converting_weights.csv", "After converting weights")
+        df = self._validate(df, 'product_dated_or_numeric_ean')
+        self.checkpointer.checkpoint(df, 'product_dropped_na_date_added_with_non_numeric_ean')
 
-        return df
+        # Convert weights to kilograms and handle non-numeric weights
+        df['weight'] = self._convert_weights(df['weight'])
+        self.checkpointer.checkpoint(df, 'product_converted_weights')
+
+        # Remove the '£' sign from prices so they can be stored as numbers
+        df['product_price'] = pd.to_numeric(df['product_price'].astype(str).str.strip('£'), errors='coerce')
+
+        # Classify products by weight for the delivery team; missing weights have no class
+        weight = df['weight'].to_numpy(dtype=float)
+        upper_bounds = list(WEIGHT_CLASSES.values())
+        df['weight_class'] = np.select(
+            [weight < upper_bounds[0]]
+            + [(weight >= lower) & (weight < upper) for lower, upper in zip(upper_bounds, upper_bounds[1:])]
+            + [weight >= upper_bounds[-1]],
+            list(WEIGHT_CLASSES) + ['Truck_Required'], default=None)
+
+        # Replace 'removed' with a boolean 'still_available'; anything but 'Still_avaliable' counts as removed
+        df.insert(df.columns.get_loc('removed'), 'still_available', (df['removed'] == 'Still_avaliable').to_numpy())
+        df = df.drop(columns=['removed'])
+        self.checkpointer.checkpoint(df, 'product_added_weight_class_and_still_available')
+
+        return self.compact(df, 'product')
+
+    def _convert_weights(self, weights: pd.Series) -> pd.Series:
+        """
+        Converts product weight strings to kilograms in a single vectorized pass.
+
+        Handles plain weights ("1.5kg", "590g", "400ml", "16oz", "77g ."), multipacks ("12 x 100g")
+        and unitless numbers, which are read as grams. Weights that are not strings or cannot be
+        parsed become 0.
+
+        :param weights: Series of raw weight values.
+        :return: Series of weights in kilograms as float.
+        """
+        # Arrow-backed strings let the string operations below run in Arrow's C++ kernels
+        try:
+            text = pa.array(weights, type=pa.string(), from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Mixed column: only string weights are parsed
+            text = pa.array(weights.where(weights.map(type) == str), type=pa.string(), from_pandas=True)
+        text = pd.Series(pd.arrays.ArrowExtensionArray(text), index=weights.index).str.lower().str.strip()
+        is_string = text.notna().to_numpy()
+        well_formed = text.str.match(WEIGHT_PATTERN).fillna(False).to_numpy(dtype=bool)
+
+        # Split "<number><unit>" by trimming: the unit is whatever the weight ends with
+        body = text.str.rstrip(' .')
+        number = body.str.rstrip(''.join(WEIGHT_UNITS) + ' ')
+        unit_conditions = [body.str.endswith(unit).fillna(False).to_numpy(dtype=bool) for unit in WEIGHT_UNITS]
+        factor = np.select(unit_conditions, list(WEIGHT_UNITS.values()), default=np.nan)
+        is_multipack = number.str.contains('x', regex=False).fillna(False).to_numpy(dtype=bool)
+
+        # Single weights; unitless numbers are grams
+        single = well_formed & ~is_multipack
+        weight_kg = self._to_float(number.where(single)) * np.nan_to_num(factor, nan=0.001)
+
+        # Multipacks; a multipack without a unit is not a valid weight
+        multipack = well_formed & is_multipack
+        if multipack.any():
+            parts = number[multipack].str.extract(MULTIPACK_WEIGHT_PATTERN)
+            weight_kg[multipack] = self._to_float(parts['quantity']) * self._to_float(parts['value']) * factor[multipack]
+
+        # Strings the pattern does not cover fall back to the slower general rules
+        irregular = is_string & ~well_formed
+        if irregular.any():
+            weight_kg[irregular] = self._convert_irregular_weights(text[irregular].astype(object))
+
+        return pd.Series(np.nan_to_num(weight_kg, nan=0.0), index=weights.index)
+
+    def _to_float(self, values: pd.Series) -> np.ndarray:
+        """
+        Parses an Arrow-backed string Series of plain numbers into a float array, with NaN for nulls.
+
+        :param values: Series of number strings.
+        :return: Array of floats.
+        """
+        return pc.cast(pa.array(values), pa.float64()).to_numpy(zero_copy_only=False)
+
+    def _convert_irregular_weights(self, text: pd.Series) -> np.ndarray:
+        """
+        Converts lower-cased, stripped weight strings that do not match WEIGHT_PATTERN to kilograms.
+
+        A weight containing 'x' is a multipack and must be "N x <weight with unit>". Otherwise
+        the first unit found is removed and the rest parsed as a number; without a unit, all
+        digits and dots are kept and read as grams. Unparseable weights become NaN.
+
+        :param text: Series of weight strings.
+        :return: Array of weights in kilograms.
+        """
+        # Multipacks: quantity times the digits of the unit weight, in the unit named after the 'x'
+        multipack = text.str.extract(MULTIPACK_PATTERN)
+        quantity = pd.to_numeric(multipack[0], errors='coerce').to_numpy(dtype=float)
+        unit_weight = pd.to_numeric(
+            multipack[1].str.replace(r'[^\d.]', '', regex=True), errors='coerce').to_numpy(dtype=float)
+        multipack_factor = np.select(
+            [multipack[1].str.contains(unit, regex=False, na=False).to_numpy(dtype=bool) for unit in WEIGHT_UNITS],
+            list(WEIGHT_UNITS.values()), default=np.nan)
+        multipack_kg = quantity * unit_weight * multipack_factor
+
+        # Single weights: strip the first matching unit and scale; unitless numbers are grams
+        single_kg = np.select(
+            [text.str.contains(unit, regex=False, na=False).to_numpy(dtype=bool) for unit in WEIGHT_UNITS],
+            [pd.to_numeric(text.str.replace(unit, '', regex=False).str.strip().str.rstrip('.'),
+                           errors='coerce').to_numpy(dtype=float) * factor
+             for unit, factor in WEIGHT_UNITS.items()],
+            default=pd.to_numeric(text.str.replace(r'[^\d.]+', '', regex=True).str.rstrip('.'),
+                                  errors='coerce').to_numpy(dtype=float) / 1000)
+
+        has_x = text.str.contains('x', regex=False, na=False).to_numpy(dtype=bool)
+        return np.where(has_x, multipack_kg, single_kg)
 
     def clean_orders_data(self, df: pd.DataFrame) -> pd.DataFrame:
         """
@@ -195,13 +521,16 @@ class DataCleaning:
         :param df: DataFrame containing orders data.
         :return: Cleaned DataFrame.
         """
+        self.checkpointer.start()
+
         # Drop rows where all elements are NaN
         df = df.dropna(how='all')
 
         # Drop unnecessary columns
         df.drop(columns=['1', 'first_name', 'last_name', 'level_0'], inplace=True)
+        self.checkpointer.checkpoint(df, 'orders_cleaned')
 
-        return df
+        return self.compact(df, 'orders')
 
     def clean_date_events_data(self, df: pd.DataFrame) -> pd.DataFrame:
         """
@@ -210,6 +539,8 @@ class DataCleaning:
         :param df: DataFrame containing date events data.
         :return: Cleaned DataFrame.
         """
+        self.checkpointer.start()
+
         # Drop rows where all elements are NaN
         df = df.dropna(how='all')
 
@@ -221,16 +552,20 @@ class DataCleaning:
         # Drop rows with NaN in critical columns
         df = df.dropna(subset=['timestamp', 'month', 'year', 'day'])
 
-        # Combine date components into a single datetime column
-        def combine_datetime(row):
-            try:
-                return pd.to_datetime(f"{int(row['year'])}-{int(row['month']):02d}-{int(row['day']):02d} {row['timestamp']}", format='%Y-%m-%d %H:%M:%S', errors='coerce')
-            except ValueError:
-                return pd.NaT
+        # Combine date components into a single datetime column in one columnar parse;
+        # invalid dates or times become NaT
+        date_times = (df['year'].astype('int64').astype(str) + '-'
+                      + df['month'].astype('int64').astype(str).str.zfill(2) + '-'
+                      + df['day'].astype('int64').astype(str).str.zfill(2) + ' '
+                      + df['timestamp'].astype(str))
+        df['timestamp'] = pd.to_datetime(date_times, format='%Y-%m-%d %H:%M:%S', errors='coerce')
 
-        df['timestamp'] = df.apply(combine_datetime, axis=1)
+        # Store the date components in the smallest integer type that holds them
+        for column in ['month', 'day', 'year']:
+            df[column] = pd.to_numeric(df[column], downcast='integer')
+        self.checkpointer.checkpoint(df, 'date_events_cleaned')
 
-        return df
+        return self.compact(df, 'date_events')
 
 
 if __name__ == '__main__':
@@ -1,9 +1,87 @@
+import io
+import json
+import math
+import multiprocessing
+import os
+import tempfile
+import threading
 import pandas as pd
 import tabula
 import requests
 import boto3
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from pypdf import PdfReader
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from sqlalchemy import text
+from typing import Iterator, List, Optional, Tuple
+
+from extraction_cache import ExtractionCache
+
+# Column types of the products CSV. Everything is read as text and converted by DataCleaning;
+# the low-cardinality columns are categories, which take far less memory than strings.
+PRODUCT_CSV_DTYPES = {
+    'product_name': str,
+    'product_price': str,
+    'weight': str,
+    'category': 'category',
+    'EAN': str,
+    'date_added': str,
+    'uuid': str,
+    'removed': 'category',
+    'product_code': str
+}
+
+# Seconds to wait for a server to respond before a download fails
+REQUEST_TIMEOUT = 30
+
+def read_pdf_pages(pdf_path: str, pages: List[int]) -> Tuple[List[pd.DataFrame], List[int]]:
+    """
+    Reads the tables on a range of PDF pages. Runs in a worker process of DataExtractor.retrieve_pdf_data.
+
+    If the range can't be read in one call, its pages are read one by one so that only the
+    failing pages are lost.
+
+    :param pdf_path: Local path of the PDF file.
+    :param pages: Page numbers to read, starting at 1.
+    :return: A tuple of the DataFrames in page order and the page numbers that could not be read.
+    """
+    try:
+        return tabula.read_pdf(pdf_path, pages=pages), []
+    except Exception:
+        df_list, failed_pages = [], []
+        for page in pages:
+            try:
+                df_list.extend(tabula.read_pdf(pdf_path, pages=page))
+            except Exception as e:
+                print(f"Error reading PDF page {page}: {e}")
+                failed_pages.append(page)
+        return df_list, failed_pages
 
 class DataExtractor:
+    def __init__(self, cache: Optional[ExtractionCache] = None):
+        """
+        Initializes the extractor.
+
+        :param cache: Cache for the S3, JSON and PDF sources. Without one, every call downloads and parses the source again.
+        """
+        self.cache = cache
+        # Bytes downloaded per source address (the URL template for the store API). RDS reads and PDFs
+        # that tabula downloads itself (serial reads without a cache) are not counted.
+        self.bytes_received = {}
+        self._bytes_received_lock = threading.Lock()
+
+    def _count_bytes(self, source: str, number_of_bytes: int):
+        """
+        Adds downloaded bytes to the total of a source.
+
+        :param source: Address of the source.
+        :param number_of_bytes: Number of bytes downloaded.
+        """
+        with self._bytes_received_lock:
+            self.bytes_received[source] = self.bytes_received.get(source, 0) + number_of_bytes
+
     def read_rds_table(self, db_connector, table_name: str) -> pd.DataFrame:
         """
         Reads data from a specified table in an RDS database into a Pandas DataFrame.
@@ -12,27 +90,149 @@ class DataExtractor:
         :param table_name: Name of the table to read from the database.
         :return: DataFrame containing the data from the specified table.
         """
-        # Read database credentials and initialize the engine
-        creds, creds_type = db_connector.read_db_creds('db_creds_rds.yaml')
-        engine = db_connector.init_db_engine(creds, creds_type)
-        
+        engine = db_connector.get_engine('db_creds_rds.yaml')
+
         # Execute query to retrieve table data
         query = f"SELECT * FROM {table_name}"
         return pd.read_sql(query, engine)
 
-    def retrieve_pdf_data(self, pdf_link: str) -> pd.DataFrame:
+    def stream_rds_table(self, db_connector, table_name: str, chunksize: int = 50000,
+                         watermark_column: Optional[str] = None, watermark=None) -> Iterator[pd.DataFrame]:
+        """
+        Reads a table from the RDS database in batches using a server-side cursor, so that only
+        one batch of rows is held in memory at a time.
+
+        With a watermark_column, rows are read in ascending order of it; with a watermark, only rows
+        whose watermark_column is above it are read, so an incremental load can skip everything it
+        has already loaded.
+
+        :param db_connector: Instance of the DatabaseConnector class.
+        :param table_name: Name of the table to read from the database.
+        :param chunksize: Number of rows per batch.
+        :param watermark_column: Column that grows with new rows, e.g. 'index'. None reads the rows in no set order.
+        :param watermark: Highest watermark_column value already loaded. None reads the whole table.
+        :return: Iterator of DataFrames, each holding at most chunksize rows.
+        """
+        engine = db_connector.get_engine('db_creds_rds.yaml')
+
+        # stream_results makes psycopg2 use a named (server-side) cursor instead of
+        # fetching the whole result set into client memory
+        query = f"SELECT * FROM {table_name}"
+        params = {}
+        if watermark_column is not None:
+            if watermark is not None:
+                query += f' WHERE "{watermark_column}" > :watermark'
+                params['watermark'] = watermark
+            # Batches come in watermark order, so a run stopped partway has loaded every row up to its last batch
+            query += f' ORDER BY "{watermark_column}"'
+        with engine.connect().execution_options(stream_results=True, max_row_buffer=chunksize) as connection:
+            yield from pd.read_sql(text(query), connection, params=params, chunksize=chunksize)
+
+    def retrieve_pdf_data(self, pdf_link: str, max_workers: int = 1) -> pd.DataFrame:
         """
         Extracts data from a PDF document and returns it as a Pandas DataFrame.
 
+        With max_workers > 1 the document is split into page ranges that are read by parallel
+        worker processes. The result is the same as a serial read; pages that fail are listed in
+        self.failed_pdf_pages instead of failing the whole extraction.
+
         :param pdf_link: URL link to the PDF file.
+        :param max_workers: Number of worker processes. 1 reads the whole document in one call.
+        :return: DataFrame containing the extracted data.
+        """
+        self.failed_pdf_pages = []
+        if self.cache is not None:
+            return self._extract_url_with_cache(pdf_link, partial(self._parse_pdf, max_workers=max_workers))
+
+        return self._parse_pdf(pdf_link, max_workers)
+
+    def _parse_pdf(self, pdf, max_workers: int = 1) -> pd.DataFrame:
+        """
+        Reads every table of a PDF into a single DataFrame.
+
+        :param pdf: URL, path, or raw bytes of the PDF.
+        :param max_workers: Number of worker processes reading page ranges in parallel.
         :return: DataFrame containing the extracted data.
         """
+        if max_workers > 1:
+            return self._parse_pdf_in_parallel(pdf, max_workers)
+
+        if isinstance(pdf, bytes):
+            pdf = io.BytesIO(pdf)
+
         # Read all pages of the PDF into a list of DataFrames
-        df_list = tabula.read_pdf(pdf_link, pages='all')
-        
+        df_list = tabula.read_pdf(pdf, pages='all')
+
         # Concatenate all DataFrames into a single DataFrame
         return pd.concat(df_list, ignore_index=True)
 
+    def _parse_pdf_in_parallel(self, pdf, max_workers: int) -> pd.DataFrame:
+        """
+        Reads the tables of a PDF in page ranges on a process pool and concatenates them in page order.
+
+        :param pdf: URL, path, or raw bytes of the PDF.
+        :param max_workers: Number of worker processes.
+        :return: DataFrame containing the extracted data.
+        """
+        with tempfile.TemporaryDirectory() as temporary_dir:
+            # Fetch the document once so the workers don't each download it
+            if isinstance(pdf, bytes) or pdf.startswith(('http://', 'https://')):
+                if not isinstance(pdf, bytes):
+                    response = requests.get(pdf, timeout=REQUEST_TIMEOUT)
+                    response.raise_for_status()
+                    content = response.content
+                    self._count_bytes(pdf, len(content))
+                else:
+                    content = pdf
+                pdf = os.path.join(temporary_dir, 'document.pdf')
+                with open(pdf, 'wb') as file:
+                    file.write(content)
+
+            number_of_pages = len(PdfReader(pdf).pages)
+            # A few ranges per worker keeps the workers busy if some pages are slower than others
+            pages_per_range = max(1, math.ceil(number_of_pages / (max_workers * 4)))
+            page_ranges = [list(range(first, min(first + pages_per_range, number_of_pages + 1)))
+                           for first in range(1, number_of_pages + 1, pages_per_range)]
+
+            # Workers are spawned rather than forked: this runs in a pipeline thread, next to tabula's JVM
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+                # executor.map returns the ranges in page order
+                results = list(executor.map(read_pdf_pages, [pdf] * len(page_ranges), page_ranges))
+
+        df_list = [df for page_dfs, _ in results for df in page_dfs]
+        self.failed_pdf_pages = [page for _, failed_pages in results for page in failed_pages]
+        print(f"Read {number_of_pages} PDF pages in {len(page_ranges)} ranges, {len(self.failed_pdf_pages)} pages failed")
+        if self.failed_pdf_pages:
+            print(f"Failed PDF pages: {self.failed_pdf_pages}")
+        if not df_list:
+            raise ValueError("No tables could be read from the PDF.")
+
+        # Concatenate all DataFrames into a single DataFrame
+        return pd.concat(df_list, ignore_index=True)
+
+    def _extract_url_with_cache(self, url: str, parse) -> pd.DataFrame:
+        """
+        Extracts a file served over HTTP through the cache. The request is conditional on the cached
+        ETag / Last-Modified, so an unchanged file is not downloaded or parsed again.
+
+        :param url: URL of the file.
+        :param parse: Function turning the downloaded bytes into a DataFrame.
+        :return: DataFrame containing the data from the file.
+        """
+        response = requests.get(url, headers=self.cache.conditional_headers(url))
+        self._count_bytes(url, len(response.content))
+        if response.status_code == 304:
+            df = self.cache.load(url)
+            if df is not None:
+                return df
+            # Evicted since the request was sent, so download it in full
+            response = requests.get(url)
+            self._count_bytes(url, len(response.content))
+        response.raise_for_status()
+
+        return self.cache.store(url, response.content, parse,
+                                etag=response.headers.get('ETag'), last_modified=response.headers.get('Last-Modified'))
+
     def list_number_of_stores(self, url: str, header: dict) -> int:
         """
         Retrieves the total number of stores from the API.
@@ -50,34 +250,114 @@ class DataExtractor:
         else:
             raise KeyError(f"'number_stores' key not found in response: {data}")
 
-    def retrieve_stores_data(self, url: str, header: dict, number_of_stores: int) -> pd.DataFrame:
+    def _create_session(self, pool_size: int, max_retries: int, backoff_factor: float) -> requests.Session:
+        """
+        Creates a pooled requests Session that retries transient failures with exponential backoff.
+
+        :param pool_size: Maximum number of connections kept open to the host.
+        :param max_retries: Number of retries for connection errors and 429/5xx responses.
+        :param backoff_factor: Base delay in seconds for the exponential backoff between retries.
+        :return: Configured requests Session.
+        """
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=['GET'],
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _fetch_store(self, session: requests.Session, url: str, header: dict, store_number: int) -> Tuple[int, Optional[dict]]:
+        """
+        Fetches the details of a single store.
+
+        :param session: Session used to send the request.
+        :param url: API endpoint template to get store details.
+        :param header: Dictionary containing API headers.
+        :param store_number: Number of the store to retrieve.
+        :return: A tuple of the response status code (0 if the request failed) and the store data, or None on failure.
+        """
+        store_url = url.format(store_number=store_number)
+        try:
+            response = session.get(store_url, headers=header, timeout=REQUEST_TIMEOUT)
+        except requests.RequestException as e:
+            print(f"Error fetching data for store {store_number}: {e}")
+            return 0, None
+
+        self._count_bytes(url, len(response.content))
+        if response.status_code == 200:
+            try:
+                return response.status_code, response.json()
+            except ValueError as e:
+                print(f"Error parsing JSON for store {store_number}: {e}")
+        else:
+            print(f"Error fetching data for store {store_number}: {response.status_code}, {response.text}")
+        return response.status_code, None
+
+    def retrieve_stores_data(self, url: str, header: dict, number_of_stores: int, max_workers: int = 1,
+                             max_retries: int = 3, backoff_factor: float = 0.5) -> pd.DataFrame:
         """
         Retrieves data for all stores from the API.
 
+        With max_workers > 1 the requests are sent concurrently from a thread pool sharing one pooled
+        session. Stores are always returned in store number order, and, as in the sequential mode,
+        nothing after the first 404 is kept. The number of failed stores is stored in
+        self.failed_store_count.
+
         :param url: API endpoint to get store details.
         :param header: Dictionary containing API headers.
         :param number_of_stores: Total number of stores to retrieve.
+        :param max_workers: Maximum number of concurrent requests. 1 fetches the stores one after another.
+        :param max_retries: Number of retries per store for connection errors and 429/5xx responses.
+        :param backoff_factor: Base delay in seconds for the exponential backoff between retries.
         :return: DataFrame containing details of all stores.
         """
         stores_data = []
-        for store_number in range(number_of_stores):
-            store_url = url.format(store_number=store_number)
-            response = requests.get(store_url, headers=header)
-            
-            if response.status_code == 200:
-                try:
-                    store_data = response.json()
-                    stores_data.append(store_data)
-                except ValueError as e:
-                    print(f"Error parsing JSON for store {store_number}: {e}")
+        failed_store_count = 0
+        with self._create_session(max(max_workers, 1), max_retries, backoff_factor) as session:
+            if max_workers <= 1:
+                results = []
+                for store_number in range(number_of_stores):
+                    status_code, store_data = self._fetch_store(session, url, header, store_number)
+                    results.append((status_code, store_data))
+                    if status_code == 404:
+                        break
+            else:
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    # executor.map yields results in submission order, i.e. by store number
+                    results = list(executor.map(
+                        lambda store_number: self._fetch_store(session, url, header, store_number),
+                        range(number_of_stores)))
+
+        for status_code, store_data in results:
+            if store_data is not None:
+                stores_data.append(store_data)
             else:
-                print(f"Error fetching data for store {store_number}: {response.status_code}, {response.text}")
-                if response.status_code == 404:
+                failed_store_count += 1
+                if status_code == 404:
                     break
-        
+
+        self.failed_store_count = failed_store_count
+        print(f"Retrieved {len(stores_data)} stores, {failed_store_count} failed")
+
         # Convert the list of store data to a DataFrame
         return pd.DataFrame(stores_data)
 
+    def _parse_s3_address(self, s3_address: str) -> Tuple[str, str]:
+        """
+        Splits an S3 address, e.g. 's3://bucket/path/file.csv', into its bucket and object key.
+
+        :param s3_address: S3 address of the file.
+        :return: A tuple of the bucket name and the object key.
+        """
+        parts = s3_address.split('/')
+        return parts[2], '/'.join(parts[3:])
+
     def extract_from_s3(self, s3_products_address: str) -> pd.DataFrame:
         """
         Downloads and extracts a CSV file from an S3 bucket.
@@ -85,15 +365,80 @@ class DataExtractor:
         :param s3_products_address: S3 address of the file.
         :return: DataFrame containing the data from the CSV file.
         """
-        bucket_name = s3_products_address.split('/')[2]
-        file_key = '/'.join(s3_products_address.split('/')[3:])
+        bucket_name, file_key = self._parse_s3_address(s3_products_address)
         s3 = boto3.client('s3')
-        
-        # Download the file from S3
-        s3.download_file(bucket_name, file_key, 'products.csv')
-        
-        # Read the CSV file into a DataFrame
-        return pd.read_csv('products.csv')
+
+        if self.cache is not None:
+            # Serve the cached copy while the object's ETag is unchanged
+            entry = self.cache.get_entry(s3_products_address)
+            etag = s3.head_object(Bucket=bucket_name, Key=file_key)['ETag']
+            if entry is not None and entry['etag'] == etag:
+                df = self.cache.load(s3_products_address)
+                if df is not None:
+                    return df
+
+            s3_object = s3.get_object(Bucket=bucket_name, Key=file_key)
+            self._count_bytes(s3_products_address, s3_object['ContentLength'])
+            return self.cache.store(s3_products_address, s3_object['Body'].read(),
+                                    lambda content: pd.read_csv(io.BytesIO(content)), etag=s3_object['ETag'])
+
+        # Parse the object body as it downloads, without writing it to disk
+        s3_object = s3.get_object(Bucket=bucket_name, Key=file_key)
+        self._count_bytes(s3_products_address, s3_object['ContentLength'])
+        return pd.read_csv(s3_object['Body'])
+
+    def stream_from_s3(self, s3_products_address: str, chunksize: int = 100000) -> Iterator[pd.DataFrame]:
+        """
+        Streams a products CSV file from an S3 bucket in batches.
+
+        The object body is parsed as it downloads, so no local file is written and only one batch
+        is held in memory at a time. The object is only requested when the first batch is read.
+        Columns are read with the types in PRODUCT_CSV_DTYPES.
+        The extraction cache is not used, as it stores whole files.
+
+        :param s3_products_address: S3 address of the file.
+        :param chunksize: Number of rows per batch.
+        :return: Iterator of DataFrames with at most chunksize rows each.
+        """
+        bucket_name, file_key = self._parse_s3_address(s3_products_address)
+        s3 = boto3.client('s3')
+        s3_object = s3.get_object(Bucket=bucket_name, Key=file_key)
+        self._count_bytes(s3_products_address, s3_object['ContentLength'])
+        yield from self.read_product_csv(s3_object['Body'], chunksize)
+
+    def read_product_csv(self, stream, chunksize: int = 100000) -> Iterator[pd.DataFrame]:
+        """
+        Parses a products CSV from a file-like object in batches.
+
+        :param stream: Readable file-like object, e.g. an S3 object body.
+        :param chunksize: Number of rows per batch.
+        :return: Iterator of DataFrames with at most chunksize rows each.
+        """
+        with pd.read_csv(stream, dtype=PRODUCT_CSV_DTYPES, chunksize=chunksize) as reader:
+            yield from reader
+
+    def get_s3_etag(self, s3_address: str) -> str:
+        """
+        Returns the ETag of an S3 object without downloading it. The ETag changes whenever the object does.
+
+        :param s3_address: S3 address of the file.
+        :return: ETag of the object.
+        """
+        bucket_name, file_key = self._parse_s3_address(s3_address)
+        s3 = boto3.client('s3')
+        return s3.head_object(Bucket=bucket_name, Key=file_key)['ETag']
+
+    def get_url_etag(self, url: str) -> Optional[str]:
+        """
+        Returns a version tag for a file served over HTTP without downloading it: its ETag header,
+        or its Last-Modified header if the server sends no ETag.
+
+        :param url: URL of the file.
+        :return: The ETag or Last-Modified value, or None if the server sends neither.
+        """
+        response = requests.head(url, allow_redirects=True)
+        response.raise_for_status()
+        return response.headers.get('ETag') or response.headers.get('Last-Modified')
 
     def extract_json_from_url(self, s3_sale_dates_address: str) -> pd.DataFrame:
         """
@@ -102,7 +447,12 @@ class DataExtractor:
         :param s3_sale_dates_address: URL to the JSON file.
         :return: DataFrame containing the data from the JSON file.
         """
+        if self.cache is not None:
+            return self._extract_url_with_cache(
+                s3_sale_dates_address, lambda content: pd.DataFrame(json.loads(content)))
+
         response = requests.get(s3_sale_dates_address)
+        self._count_bytes(s3_sale_dates_address, len(response.content))
         data = response.json()
         
         # Convert the JSON data to a DataFrame
@@ -1,9 +1,123 @@
+import io
+import threading
 import yaml
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, inspect, text, types
 import pandas as pd
-from typing import Tuple
+import time
+from typing import Iterable, List, Optional, Tuple
+
+# Table in the local database that stores the high-water mark of each incrementally loaded source
+WATERMARK_TABLE = 'etl_watermarks'
+CREATE_WATERMARK_TABLE = f"""
+    CREATE TABLE IF NOT EXISTS {WATERMARK_TABLE} (
+        source VARCHAR(255) PRIMARY KEY,
+        watermark TEXT NOT NULL,
+        updated_at TIMESTAMP NOT NULL
+    )
+"""
+
+# Final column types of the star schema tables, matching Milestone_3/Full_M3_Script.sql. Tables are created
+# with these types when they are loaded, so no column has to be cast after the load. Columns not listed
+# get the type pandas infers.
+TABLE_COLUMN_TYPES = {
+    'orders_table': {
+        'date_uuid': types.Uuid(as_uuid=False),
+        'user_uuid': types.Uuid(as_uuid=False),
+        'card_number': types.VARCHAR(19),
+        'store_code': types.VARCHAR(12),
+        'product_code': types.VARCHAR(11),
+        'product_quantity': types.SmallInteger()
+    },
+    'dim_users': {
+        'first_name': types.VARCHAR(255),
+        'last_name': types.VARCHAR(255),
+        'date_of_birth': types.Date(),
+        'country_code': types.VARCHAR(3),
+        'user_uuid': types.Uuid(as_uuid=False),
+        'join_date': types.Date()
+    },
+    'dim_store_details': {
+        'longitude': types.REAL(),
+        'locality': types.VARCHAR(255),
+        'store_code': types.VARCHAR(12),
+        'staff_numbers': types.SmallInteger(),
+        'opening_date': types.Date(),
+        'store_type': types.VARCHAR(255),
+        'latitude': types.REAL(),
+        'country_code': types.VARCHAR(2),
+        'continent': types.VARCHAR(255)
+    },
+    'dim_products': {
+        'product_price': types.Float(),
+        'weight': types.Float(),
+        'EAN': types.VARCHAR(17),
+        'product_code': types.VARCHAR(11),
+        'date_added': types.Date(),
+        'uuid': types.Uuid(as_uuid=False),
+        'still_available': types.Boolean(),
+        'weight_class': types.VARCHAR(14)
+    },
+    'dim_date_times': {
+        'month': types.VARCHAR(2),
+        'year': types.VARCHAR(4),
+        'day': types.VARCHAR(2),
+        'time_period': types.VARCHAR(10),
+        'date_uuid': types.Uuid(as_uuid=False)
+    },
+    'dim_card_details': {
+        'card_number': types.VARCHAR(19),
+        'expiry_date': types.VARCHAR(19),
+        'date_payment_confirmed': types.Date()
+    }
+}
+
+# Primary keys of the dimension tables, created together with the tables
+TABLE_PRIMARY_KEYS = {
+    'dim_card_details': ['card_number'],
+    'dim_date_times': ['date_uuid'],
+    'dim_products': ['product_code'],
+    'dim_store_details': ['store_code'],
+    'dim_users': ['user_uuid']
+}
+
+# Foreign keys of the star schema: table -> [(column, referenced table, referenced column)]
+TABLE_FOREIGN_KEYS = {
+    'orders_table': [
+        ('card_number', 'dim_card_details', 'card_number'),
+        ('date_uuid', 'dim_date_times', 'date_uuid'),
+        ('product_code', 'dim_products', 'product_code'),
+        ('store_code', 'dim_store_details', 'store_code'),
+        ('user_uuid', 'dim_users', 'user_uuid')
+    ]
+}
+
+# Secondary indexes on the join columns of the Milestone 4 queries
+TABLE_INDEXES = {
+    'orders_table': [['store_code'], ['product_code'], ['date_uuid']]
+}
+
+# Suffix of the tables a staged load writes to before they replace the live tables
+STAGED_TABLE_SUFFIX = '_staged'
 
 class DatabaseConnector:
+    def __init__(self, pool_size: int = 5, max_overflow: int = 10, pool_pre_ping: bool = True):
+        """
+        Initializes the connector. Engines are created lazily by get_engine and cached per
+        credentials file (and so per credentials type), so each connection pool is built once per run.
+
+        :param pool_size: Number of connections kept open in each engine's pool.
+        :param max_overflow: Number of extra connections allowed above pool_size under load.
+        :param pool_pre_ping: Test pooled connections before use and replace stale ones.
+        """
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pool_pre_ping = pool_pre_ping
+        self._engines = {}
+        self._engines_lock = threading.Lock()
+        # Tables loaded with upload_to_db(staged=True) and not published yet
+        self.staged_tables = set()
+        self._staged_tables_lock = threading.Lock()
+
     def read_db_creds(self, file_name: str) -> Tuple[dict, str]:
         """
         Reads the database credentials from a YAML file and returns them as a dictionary
@@ -36,42 +150,367 @@ class DatabaseConnector:
         :param creds_type: A string specifying the type of credentials ('RDS' or 'LOCAL').
         :return: The initialized SQLAlchemy database engine.
         """
+        pool_options = {
+            'pool_size': self.pool_size,
+            'max_overflow': self.max_overflow,
+            'pool_pre_ping': self.pool_pre_ping
+        }
+
         # Initialize database engine based on the type of credentials
         if creds_type == 'RDS':
-            return create_engine(f"postgresql://{creds['RDS_USER']}:{creds['RDS_PASSWORD']}@{creds['RDS_HOST']}:{creds['RDS_PORT']}/{creds['RDS_DATABASE']}")
+            return create_engine(f"postgresql://{creds['RDS_USER']}:{creds['RDS_PASSWORD']}@{creds['RDS_HOST']}:{creds['RDS_PORT']}/{creds['RDS_DATABASE']}", **pool_options)
         elif creds_type == 'LOCAL':
-            return create_engine(f"postgresql://{creds['LOCAL_USER']}:{creds['LOCAL_PASSWORD']}@{creds['LOCAL_HOST']}:{creds['LOCAL_PORT']}/{creds['LOCAL_DATABASE']}")
+            return create_engine(f"postgresql://{creds['LOCAL_USER']}:{creds['LOCAL_PASSWORD']}@{creds['LOCAL_HOST']}:{creds['LOCAL_PORT']}/{creds['LOCAL_DATABASE']}", **pool_options)
         else:
             raise ValueError("Invalid credentials type. Must be 'RDS' or 'LOCAL'.")
 
+    def get_engine(self, file_name: str):
+        """
+        Returns the cached SQLAlchemy engine for a credentials file, creating it on first use.
+
+        :param file_name: The name of the YAML file containing the database credentials.
+        :return: The SQLAlchemy database engine for those credentials.
+        """
+        # Pipeline stages run in threads; make sure only one engine is created per file
+        with self._engines_lock:
+            if file_name not in self._engines:
+                creds, creds_type = self.read_db_creds(file_name)
+                self._engines[file_name] = self.init_db_engine(creds, creds_type)
+            return self._engines[file_name]
+
+    def dispose(self):
+        """
+        Closes all pooled connections of the cached engines and clears the cache.
+        """
+        with self._engines_lock:
+            for engine in self._engines.values():
+                engine.dispose()
+            self._engines.clear()
+
     def list_db_tables(self) -> list:
         """
         Lists all tables in the database.
 
         :return: A list of all table names in the database.
         """
-        # Load credentials and initialize engine
-        creds, creds_type = self.read_db_creds('db_creds_rds.yaml')
-        engine = self.init_db_engine(creds, creds_type)
-        
+        engine = self.get_engine('db_creds_rds.yaml')
+
         # Execute query to retrieve table names
         with engine.connect() as connection:
             result = connection.execute(text("SELECT table_name FROM information_schema.tables WHERE table_schema='public';"))
             return [row[0] for row in result]
 
-    def upload_to_db(self, data_frame: pd.DataFrame, table_name: str):
+    def _create_table(self, connection, data_frame: pd.DataFrame, table_name: str, if_exists: str = 'replace',
+                      schema_table: Optional[str] = None, with_primary_key: bool = True):
+        """
+        Creates the empty table a DataFrame is loaded into. Star schema tables get their final column
+        types from TABLE_COLUMN_TYPES and their primary key from TABLE_PRIMARY_KEYS; other tables the
+        column types to_sql would use.
+
+        :param connection: Open SQLAlchemy connection; the caller controls the transaction.
+        :param data_frame: The Pandas DataFrame that will be loaded.
+        :param table_name: The name of the table.
+        :param if_exists: What to do if the table exists: 'replace' it or 'append' to it.
+        :param schema_table: Star schema table whose column types are used. Defaults to table_name.
+        :param with_primary_key: Whether the primary key is created with the table.
+        """
+        schema_table = schema_table if schema_table is not None else table_name
+        if schema_table not in TABLE_COLUMN_TYPES:
+            data_frame.head(0).to_sql(table_name, connection, if_exists=if_exists, index=False)
+            return
+        if if_exists == 'append' and inspect(connection).has_table(table_name):
+            return
+
+        column_types = {column: column_type for column, column_type in TABLE_COLUMN_TYPES[schema_table].items()
+                        if column in data_frame.columns}
+        create_sql = pd.io.sql.get_schema(data_frame.head(0), table_name, con=connection, dtype=column_types).rstrip()
+        if with_primary_key:
+            # Named like the keys publish_staged_tables builds, so both load paths give the same schema
+            for column in TABLE_PRIMARY_KEYS.get(schema_table, []):
+                create_sql = f'{create_sql[:-1].rstrip()}, \n\tCONSTRAINT "pk_{column}" PRIMARY KEY ("{column}")\n)'
+        connection.execute(text(f'DROP TABLE IF EXISTS "{table_name}"'))
+        connection.execute(text(create_sql))
+
+    def _copy_rows(self, connection, data_frame: pd.DataFrame, table_name: str, chunksize: int = 100000) -> int:
+        """
+        Streams the rows of a DataFrame into an existing PostgreSQL table with COPY FROM STDIN.
+
+        :param connection: Open SQLAlchemy connection; the caller controls the transaction.
+        :param data_frame: The Pandas DataFrame to upload.
+        :param table_name: The name of the existing table.
+        :param chunksize: Number of rows sent per COPY statement.
+        :return: Size of the CSV data sent, in characters.
+        """
+        columns = ', '.join(f'"{column}"' for column in data_frame.columns)
+        copy_sql = f'COPY "{table_name}" ({columns}) FROM STDIN WITH (FORMAT csv)'
+
+        sent = 0
+        cursor = connection.connection.cursor()
+        try:
+            for start in range(0, len(data_frame), chunksize):
+                buffer = io.StringIO()
+                data_frame.iloc[start:start + chunksize].to_csv(buffer, index=False, header=False)
+                sent += buffer.tell()
+                buffer.seek(0)
+                if hasattr(cursor, 'copy_expert'):
+                    # psycopg2
+                    cursor.copy_expert(copy_sql, buffer)
+                else:
+                    # psycopg 3
+                    with cursor.copy(copy_sql) as copy:
+                        copy.write(buffer.getvalue())
+        finally:
+            cursor.close()
+        return sent
+
+    def upload_to_db(self, data_frame: pd.DataFrame, table_name: str, if_exists: str = 'replace',
+                     use_copy: bool = True, staged: bool = False) -> Optional[int]:
         """
         Uploads a Pandas DataFrame to a specified table in the database.
 
+        PostgreSQL targets are bulk loaded with COPY; other databases (e.g. a local SQLite stand-in)
+        fall back to DataFrame.to_sql.
+
         :param data_frame: The Pandas DataFrame to upload.
         :param table_name: The name of the table to upload the data to.
+        :param if_exists: What to do if the table exists: 'replace' it or 'append' to it.
+        :param use_copy: Use COPY for PostgreSQL targets. Set to False to always use to_sql.
+        :param staged: Load into an unindexed staging table instead, which replaces the table when
+            publish_staged_tables is called.
+        :return: Size of the data sent with COPY in characters, or None if it was uploaded with to_sql.
         """
-        # Load credentials and initialize engine
-        creds, creds_type = self.read_db_creds('db_creds_local.yaml')
-        engine = self.init_db_engine(creds, creds_type)
-        
+        engine = self.get_engine('db_creds_local.yaml')
+        target_table = f"{table_name}{STAGED_TABLE_SUFFIX}" if staged else table_name
+
         # Upload DataFrame to the specified table
-        data_frame.to_sql(table_name, engine, if_exists='replace', index=False)
+        sent = None
+        with engine.begin() as connection:
+            self._create_table(connection, data_frame, target_table, if_exists,
+                               schema_table=table_name, with_primary_key=not staged)
+            if use_copy and engine.dialect.name == 'postgresql':
+                sent = self._copy_rows(connection, data_frame, target_table)
+            else:
+                data_frame.to_sql(target_table, connection, if_exists='append', index=False)
+        if staged:
+            with self._staged_tables_lock:
+                self.staged_tables.add(table_name)
+        return sent
+
+    def _constraint_statements(self, table_name: str, target_table: str, published_tables: Iterable[str],
+                               suffix: str, postgres: bool, referenced_tables: Iterable[str]) -> List[str]:
+        """
+        Builds the statements creating the primary key, foreign keys and secondary indexes of a star schema table.
+
+        :param table_name: Star schema table whose keys and indexes are created.
+        :param target_table: Table the statements run on, e.g. its staging table.
+        :param published_tables: Tables published together; foreign keys to them reference their staging tables.
+        :param suffix: Suffix added to the constraint and index names.
+        :param postgres: Whether the database is PostgreSQL. Elsewhere primary keys become unique
+            indexes and foreign keys are skipped, as they cannot be added to existing tables.
+        :param referenced_tables: Tables that exist once published; foreign keys to other tables are skipped.
+        :return: List of SQL statements.
+        """
+        statements = []
+        for column in TABLE_PRIMARY_KEYS.get(table_name, []):
+            if postgres:
+                statements.append(f'ALTER TABLE "{target_table}" ADD CONSTRAINT "pk_{column}{suffix}" PRIMARY KEY ("{column}")')
+            else:
+                statements.append(f'CREATE UNIQUE INDEX "pk_{column}{suffix}" ON "{target_table}" ("{column}")')
+
+        if postgres:
+            for column, referenced_table, referenced_column in TABLE_FOREIGN_KEYS.get(table_name, []):
+                if referenced_table not in referenced_tables:
+                    continue
+                if referenced_table in published_tables:
+                    referenced_table = f"{referenced_table}{suffix}"
+                statements.append(
+                    f'ALTER TABLE "{target_table}" ADD CONSTRAINT "fk_orders_{column}{suffix}" '
+                    f'FOREIGN KEY ("{column}") REFERENCES "{referenced_table}" ("{referenced_column}")')
+
+        for columns in TABLE_INDEXES.get(table_name, []):
+            index_name = f"ix_{table_name}_{'_'.join(columns)}{suffix}"
+            index_columns = ', '.join(f'"{column}"' for column in columns)
+            statements.append(f'CREATE INDEX "{index_name}" ON "{target_table}" ({index_columns})')
+        return statements
+
+    def publish_staged_tables(self, table_names: List[str]):
+        """
+        Builds the keys and indexes of tables loaded with upload_to_db(staged=True) and swaps them in
+        for the live tables.
+
+        Loading into tables without keys or indexes avoids maintaining them row by row; here they
+        are built once per table instead. On PostgreSQL the primary keys, foreign keys and secondary
+        indexes are built on the staging tables, then the live tables are dropped and the staging
+        tables renamed in the same transaction, so readers see either the old or the new schema.
+        Publish the fact table and its dimension tables together: dropping a live dimension table
+        also drops the foreign keys that reference it.
+
+        Foreign keys to dimension tables that are neither published nor live are skipped.
+
+        :param table_names: Names of the star schema tables to publish, e.g. those in staged_tables.
+        :raises ValueError: If a table has no staging table.
+        """
+        if not table_names:
+            print("No staged tables to publish")
+            return
+        # Dimension tables first, so their primary keys exist when the foreign keys to them are built
+        table_names = sorted(table_names, key=lambda table: table in TABLE_FOREIGN_KEYS)
+        engine = self.get_engine('db_creds_local.yaml')
+        postgres = engine.dialect.name == 'postgresql'
+        start = time.perf_counter()
+
+        with engine.begin() as connection:
+            inspector = inspect(connection)
+            missing = [table for table in table_names if not inspector.has_table(f"{table}{STAGED_TABLE_SUFFIX}")]
+            if missing:
+                raise ValueError(f"No staged data to publish for tables: {missing}")
+            referenced_tables = set(table_names) | {table for table in TABLE_PRIMARY_KEYS if inspector.has_table(table)}
+            skipped = [(table, referenced_table) for table in table_names
+                       for _, referenced_table, _ in TABLE_FOREIGN_KEYS.get(table, [])
+                       if referenced_table not in referenced_tables]
+            for table, referenced_table in skipped:
+                print(f"Foreign key from {table} to {referenced_table} skipped: {referenced_table} does not exist")
+
+            if postgres:
+                # Build keys and indexes while readers still use the live tables
+                for table in table_names:
+                    for statement in self._constraint_statements(
+                            table, f"{table}{STAGED_TABLE_SUFFIX}", table_names, STAGED_TABLE_SUFFIX, postgres,
+                            referenced_tables):
+                        connection.execute(text(statement))
+
+            # Swap the staging tables in
+            for table in table_names:
+                connection.execute(text(f'DROP TABLE IF EXISTS "{table}"{" CASCADE" if postgres else ""}'))
+                connection.execute(text(f'ALTER TABLE "{table}{STAGED_TABLE_SUFFIX}" RENAME TO "{table}"'))
+
+            if postgres:
+                # Give the constraints and indexes their final names
+                for table in table_names:
+                    for column in TABLE_PRIMARY_KEYS.get(table, []):
+                        connection.execute(text(
+                            f'ALTER TABLE "{table}" RENAME CONSTRAINT "pk_{column}{STAGED_TABLE_SUFFIX}" TO "pk_{column}"'))
+                    for column, referenced_table, _ in TABLE_FOREIGN_KEYS.get(table, []):
+                        if referenced_table not in referenced_tables:
+                            continue
+                        connection.execute(text(
+                            f'ALTER TABLE "{table}" RENAME CONSTRAINT "fk_orders_{column}{STAGED_TABLE_SUFFIX}" TO "fk_orders_{column}"'))
+                    for columns in TABLE_INDEXES.get(table, []):
+                        index_name = f"ix_{table}_{'_'.join(columns)}"
+                        connection.execute(text(f'ALTER INDEX "{index_name}{STAGED_TABLE_SUFFIX}" RENAME TO "{index_name}"'))
+            else:
+                for table in table_names:
+                    for statement in self._constraint_statements(table, table, table_names, '', postgres, referenced_tables):
+                        connection.execute(text(statement))
+
+        with self._staged_tables_lock:
+            self.staged_tables.difference_update(table_names)
+        print(f"Published {len(table_names)} staged tables in {time.perf_counter() - start:.2f} s")
+
+    def _ensure_unique_key(self, engine, table_name: str, key_columns: List[str]):
+        """
+        Makes sure the key columns of a table are covered by a primary key, unique constraint or
+        unique index, which INSERT ... ON CONFLICT requires. Creates a unique index if none exists.
+
+        :param engine: SQLAlchemy engine of the target database.
+        :param table_name: The name of the table.
+        :param key_columns: Columns that identify a row.
+        """
+        inspector = inspect(engine)
+        keys = [inspector.get_pk_constraint(table_name)['constrained_columns']]
+        keys += [constraint['column_names'] for constraint in inspector.get_unique_constraints(table_name)]
+        keys += [index['column_names'] for index in inspector.get_indexes(table_name) if index['unique']]
+        if any(set(key) == set(key_columns) for key in keys):
+            return
+
+        columns = ', '.join(f'"{column}"' for column in key_columns)
+        index_name = f"uq_{table_name}_{'_'.join(key_columns)}"
+        with engine.begin() as connection:
+            connection.execute(text(f'CREATE UNIQUE INDEX IF NOT EXISTS "{index_name}" ON "{table_name}" ({columns})'))
+
+    def upsert_to_db(self, data_frame: pd.DataFrame, table_name: str, key_columns: List[str]) -> Optional[int]:
+        """
+        Inserts new rows and updates existing ones in a table, matching rows on the key columns.
+
+        The rows are loaded into a staging table first (with COPY on PostgreSQL, where the staging
+        table copies the target's column types) and merged with INSERT ... ON CONFLICT in one
+        transaction. If the table does not exist yet it is created from the DataFrame.
+
+        :param data_frame: The Pandas DataFrame to upload.
+        :param table_name: The name of the table to upload the data to.
+        :param key_columns: Columns that identify a row, e.g. the table's primary key.
+        :return: Size of the data sent with COPY in characters, or None if it was uploaded with to_sql.
+        """
+        engine = self.get_engine('db_creds_local.yaml')
+
+        # A row may only be updated once per statement, so keep the last version of each key
+        data_frame = data_frame.drop_duplicates(subset=key_columns, keep='last')
+
+        if not inspect(engine).has_table(table_name):
+            sent = self.upload_to_db(data_frame, table_name)
+            self._ensure_unique_key(engine, table_name, key_columns)
+            return sent
+        self._ensure_unique_key(engine, table_name, key_columns)
+
+        staging_table = f"{table_name}_staging"
+        columns = ', '.join(f'"{column}"' for column in data_frame.columns)
+        keys = ', '.join(f'"{column}"' for column in key_columns)
+        updates = ', '.join(f'"{column}" = excluded."{column}"' for column in data_frame.columns if column not in key_columns)
+        on_conflict = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+
+        sent = None
+        with engine.begin() as connection:
+            if engine.dialect.name == 'postgresql':
+                connection.execute(text(f'CREATE TEMP TABLE "{staging_table}" (LIKE "{table_name}") ON COMMIT DROP'))
+                sent = self._copy_rows(connection, data_frame, staging_table)
+            else:
+                data_frame.to_sql(staging_table, connection, if_exists='replace', index=False)
+
+            # 'WHERE true' keeps SQLite from reading ON CONFLICT as part of the SELECT
+            connection.execute(text(
+                f'INSERT INTO "{table_name}" ({columns}) SELECT {columns} FROM "{staging_table}" WHERE true '
+                f'ON CONFLICT ({keys}) {on_conflict}'))
+
+            if engine.dialect.name != 'postgresql':
+                connection.execute(text(f'DROP TABLE "{staging_table}"'))
+        return sent
+
+    def get_watermark(self, source: str) -> Optional[str]:
+        """
+        Returns the high-water mark recorded for a source by the last incremental load.
+
+        :param source: Name of the source, e.g. 'orders_table'.
+        :return: The stored watermark, or None if the source has not been loaded incrementally yet.
+        """
+        engine = self.get_engine('db_creds_local.yaml')
+        with engine.begin() as connection:
+            connection.execute(text(CREATE_WATERMARK_TABLE))
+            result = connection.execute(
+                text(f"SELECT watermark FROM {WATERMARK_TABLE} WHERE source = :source"), {'source': source})
+            row = result.fetchone()
+        return row[0] if row is not None else None
+
+    def set_watermark(self, source: str, watermark: str, connection=None):
+        """
+        Records the high-water mark of a source after a successful incremental load.
+
+        :param source: Name of the source, e.g. 'orders_table'.
+        :param watermark: The new watermark, e.g. the highest 'index' loaded or the source's ETag.
+        :param connection: Open connection to record the watermark in the caller's transaction.
+            By default it is recorded in a transaction of its own.
+        """
+        if connection is None:
+            engine = self.get_engine('db_creds_local.yaml')
+            with engine.begin() as connection:
+                self.set_watermark(source, watermark, connection)
+            return
+
+        connection.execute(text(CREATE_WATERMARK_TABLE))
+        connection.execute(text(
+            f"INSERT INTO {WATERMARK_TABLE} (source, watermark, updated_at) "
+            "VALUES (:source, :watermark, CURRENT_TIMESTAMP) "
+            "ON CONFLICT (source) DO UPDATE SET watermark = excluded.watermark, updated_at = excluded.updated_at"),
+            {'source': source, 'watermark': str(watermark)})
 
 if __name__ == '__main__':
     pass
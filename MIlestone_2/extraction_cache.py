@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+import pandas as pd
+
+from output_sinks import write_parquet
+
+
+class ExtractionCache:
+    def __init__(self, cache_dir: str = 'extraction_cache', max_size_bytes: int = 1024 ** 3,
+                 max_age_seconds: float = 7 * 24 * 3600):
+        """
+        On-disk cache of parsed source files (S3 CSV, JSON, PDF), stored as Parquet.
+
+        Parsed files are addressed by the SHA-256 of their raw content, so identical content is only
+        parsed once even if it is fetched from a new address or re-uploaded. For each source the
+        cache also keeps its ETag / Last-Modified, so an unchanged source can be revalidated without
+        downloading it. Entries are evicted when older than max_age_seconds, and least recently used
+        entries are evicted when the cache grows beyond max_size_bytes.
+
+        :param cache_dir: Directory holding the Parquet files and the index.
+        :param max_size_bytes: Maximum total size of the cached Parquet files.
+        :param max_age_seconds: Maximum age of a cached entry.
+        """
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self.max_age_seconds = max_age_seconds
+        self.index_file = os.path.join(cache_dir, 'index.json')
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(cache_dir, 'objects'), exist_ok=True)
+        self._index = self._read_index()
+
+    def _read_index(self) -> dict:
+        """
+        Loads the index of cached sources from disk.
+
+        :return: Dictionary of source addresses and their cache entries.
+        """
+        if not os.path.exists(self.index_file):
+            return {}
+        with open(self.index_file, 'r') as file:
+            return json.load(file)
+
+    def _write_index(self):
+        """
+        Saves the index of cached sources to disk, replacing the old file atomically.
+        """
+        temporary_file = f"{self.index_file}.tmp"
+        with open(temporary_file, 'w') as file:
+            json.dump(self._index, file, indent=2)
+        os.replace(temporary_file, self.index_file)
+
+    def _object_path(self, content_hash: str) -> str:
+        return os.path.join(self.cache_dir, 'objects', f"{content_hash}.parquet")
+
+    def _is_expired(self, entry: dict) -> bool:
+        return time.time() - entry['stored_at'] > self.max_age_seconds
+
+    def get_entry(self, source: str) -> Optional[dict]:
+        """
+        Returns the cache entry of a source, or None if it is not cached or has expired.
+
+        :param source: Address of the source, e.g. its URL.
+        :return: Dictionary with the entry's 'etag', 'last_modified', 'content_hash' and timestamps.
+        """
+        with self._lock:
+            entry = self._index.get(source)
+            if entry is None or self._is_expired(entry) or not os.path.exists(self._object_path(entry['content_hash'])):
+                return None
+            return dict(entry)
+
+    def conditional_headers(self, source: str) -> dict:
+        """
+        Builds HTTP headers that make the server answer 304 Not Modified if the cached copy is current.
+
+        :param source: URL of the source.
+        :return: Dictionary of If-None-Match / If-Modified-Since headers; empty if the source is not cached.
+        """
+        entry = self.get_entry(source)
+        headers = {}
+        if entry is not None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def load(self, source: str) -> Optional[pd.DataFrame]:
+        """
+        Reads the cached DataFrame of a source and marks it as recently used.
+
+        :param source: Address of the source.
+        :return: The cached DataFrame, or None if another thread evicted it since it was looked up.
+        """
+        with self._lock:
+            entry = self._index.get(source)
+            if entry is None:
+                return None
+            print(f"Serving {source} from the extraction cache")
+            entry['last_access'] = time.time()
+            self._write_index()
+            # Read under the lock, so another thread's eviction cannot delete the file while it is read
+            return pd.read_parquet(self._object_path(entry['content_hash']))
+
+    def store(self, source: str, content: bytes, parse: Callable[[bytes], pd.DataFrame],
+              etag: Optional[str] = None, last_modified: Optional[str] = None) -> pd.DataFrame:
+        """
+        Caches freshly downloaded content of a source, parsing it only if the same content has not
+        been parsed before.
+
+        :param source: Address of the source.
+        :param content: Raw bytes downloaded from the source.
+        :param parse: Function turning the raw bytes into a DataFrame.
+        :param etag: ETag the source was served with, if any.
+        :param last_modified: Last-Modified value the source was served with, if any.
+        :return: The parsed DataFrame.
+        """
+        content_hash = hashlib.sha256(content).hexdigest()
+        path = self._object_path(content_hash)
+        # Parsed outside the lock, so sources are parsed concurrently; the file is written, registered
+        # and read under the lock, so another thread's eviction cannot delete it in between
+        df = parse(content) if not os.path.exists(path) else None
+
+        now = time.time()
+        with self._lock:
+            if os.path.exists(path):
+                if df is None:
+                    print(f"Content of {source} already parsed, reusing the cached copy")
+                    df = pd.read_parquet(path)
+            else:
+                if df is None:
+                    df = parse(content)
+                self._write_parquet(df, path)
+
+            self._index[source] = {
+                'etag': etag,
+                'last_modified': last_modified,
+                'content_hash': content_hash,
+                'size': os.path.getsize(path),
+                'stored_at': now,
+                'last_access': now
+            }
+            self._evict()
+            self._write_index()
+        return df
+
+    def _write_parquet(self, df: pd.DataFrame, path: str):
+        """
+        Writes a DataFrame to Parquet through a temporary file, so readers never see a partial file.
+
+        :param df: DataFrame to write.
+        :param path: Path of the Parquet file.
+        """
+        temporary_path = f"{path}.tmp"
+        write_parquet(df, temporary_path)
+        os.replace(temporary_path, path)
+
+    def _evict(self):
+        """
+        Removes expired entries, then least recently used entries until the cache fits in
+        max_size_bytes. The Parquet files of removed entries are deleted once no entry refers to
+        them. Expects the lock to be held.
+        """
+        removed = [entry for entry in self._index.values() if self._is_expired(entry)]
+        self._index = {source: entry for source, entry in self._index.items() if not self._is_expired(entry)}
+
+        sizes = {entry['content_hash']: entry['size'] for entry in self._index.values()}
+        by_last_access = sorted(self._index.items(), key=lambda item: item[1]['last_access'])
+        while sum(sizes.values()) > self.max_size_bytes and by_last_access:
+            source, entry = by_last_access.pop(0)
+            del self._index[source]
+            removed.append(entry)
+            if all(other['content_hash'] != entry['content_hash'] for other in self._index.values()):
+                sizes.pop(entry['content_hash'], None)
+
+        referenced = {entry['content_hash'] for entry in self._index.values()}
+        for content_hash in {entry['content_hash'] for entry in removed} - referenced:
+            path = self._object_path(content_hash)
+            if os.path.exists(path):
+                os.remove(path)
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,192 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+
+def resident_memory_bytes() -> Optional[int]:
+    """
+    Returns the resident memory of this process, including memory allocated by NumPy and Arrow.
+
+    :return: Resident set size in bytes, or None where /proc is not available (e.g. outside Linux).
+    """
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return None
+
+
+class PipelineMetrics:
+    def __init__(self, log_file: Optional[str] = 'pipeline_metrics.jsonl', prometheus_file: Optional[str] = None,
+                 sample_interval: float = 0.05):
+        """
+        Records metrics of the extract, clean and upload stage of every source: wall time, rows in
+        and out, rows dropped per validation rule, bytes transferred and peak memory.
+
+        Each finished stage is appended to log_file as one JSON object per line. write_prometheus()
+        writes the totals per source and stage in the Prometheus text format, e.g. for the node
+        exporter's textfile collector.
+
+        Peak memory is the highest resident memory of the whole process while a stage ran, sampled
+        every sample_interval seconds. Sources load concurrently, so it includes the memory of
+        stages running at the same time.
+
+        :param log_file: Path of the JSON lines log. None only keeps the records in memory.
+        :param prometheus_file: Path of the Prometheus text file written by write_prometheus().
+        :param sample_interval: Seconds between memory samples.
+        """
+        self.log_file = log_file
+        self.prometheus_file = prometheus_file
+        self.sample_interval = sample_interval
+        self.records = []
+        self._lock = threading.Lock()
+        self._active = []
+        self._sampler = None
+
+    def _sample_memory(self, stop: threading.Event):
+        """
+        Updates the peak memory of the running stages until stop is set.
+
+        :param stop: Event set once no stage is running.
+        """
+        while not stop.wait(self.sample_interval):
+            resident = resident_memory_bytes()
+            with self._lock:
+                for record in self._active:
+                    record['peak_memory_bytes'] = max(record['peak_memory_bytes'], resident)
+
+    @contextmanager
+    def stage(self, source: str, stage: str, rows_in: Optional[int] = None) -> Iterator[dict]:
+        """
+        Measures one stage of a source. The block fills in what only it knows, i.e. 'rows_out',
+        'bytes' and 'rows_dropped'; the record is logged when the block exits, also if it fails.
+
+        :param source: Name of the source, e.g. 'products'.
+        :param stage: Name of the stage: 'extract', 'clean' or 'upload'.
+        :param rows_in: Number of rows passed to the stage, if known beforehand.
+        :return: Dictionary of the stage's metrics.
+        """
+        resident = resident_memory_bytes()
+        record = {
+            'source': source, 'stage': stage, 'rows_in': rows_in, 'rows_out': None, 'rows_dropped': {},
+            'bytes': None, 'seconds': None, 'peak_memory_bytes': resident, 'status': 'ok'
+        }
+        if resident is not None:
+            with self._lock:
+                self._active.append(record)
+                if self._sampler is None:
+                    stop = threading.Event()
+                    self._sampler = (threading.Thread(target=self._sample_memory, args=(stop,), daemon=True), stop)
+                    self._sampler[0].start()
+
+        start = time.perf_counter()
+        try:
+            yield record
+        except Exception:
+            record['status'] = 'error'
+            raise
+        finally:
+            record['seconds'] = round(time.perf_counter() - start, 6)
+            record['timestamp'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+            sampler = None
+            with self._lock:
+                if resident is not None:
+                    self._active.remove(record)
+                    record['peak_memory_bytes'] = max(record['peak_memory_bytes'], resident_memory_bytes())
+                    if not self._active:
+                        sampler, self._sampler = self._sampler, None
+                        sampler[1].set()
+                self.records.append(record)
+                self._log(record)
+            if sampler is not None:
+                sampler[0].join()
+
+    def _log(self, record: dict):
+        """
+        Appends a stage record to the JSON lines log. Expects the lock to be held.
+
+        :param record: Metrics of the finished stage.
+        """
+        if self.log_file is None:
+            return
+        with open(self.log_file, 'a') as file:
+            file.write(json.dumps(record) + '\n')
+
+    def totals(self) -> dict:
+        """
+        Adds up the records of each source and stage, e.g. over the batches of a streamed table.
+
+        :return: Dictionary of (source, stage) pairs and their summed metrics; peak memory is the maximum.
+        """
+        totals = {}
+        with self._lock:
+            records = list(self.records)
+        for record in records:
+            total = totals.setdefault((record['source'], record['stage']), {
+                'runs': 0, 'seconds': 0.0, 'rows_in': 0, 'rows_out': 0, 'bytes': 0,
+                'peak_memory_bytes': 0, 'errors': 0, 'rows_dropped': {}
+            })
+            total['runs'] += 1
+            total['errors'] += record['status'] == 'error'
+            for key in ['seconds', 'rows_in', 'rows_out', 'bytes']:
+                total[key] += record[key] or 0
+            total['peak_memory_bytes'] = max(total['peak_memory_bytes'], record['peak_memory_bytes'] or 0)
+            for rule, count in record['rows_dropped'].items():
+                total['rows_dropped'][rule] = total['rows_dropped'].get(rule, 0) + count
+        return totals
+
+    def write_prometheus(self, file_name: Optional[str] = None):
+        """
+        Writes the totals per source and stage as a Prometheus text file, replacing the old file
+        atomically so a collector never reads a partial file.
+
+        :param file_name: Path of the file. Defaults to prometheus_file; nothing is written if both are None.
+        """
+        file_name = file_name or self.prometheus_file
+        if file_name is None:
+            return
+
+        metrics = [
+            ('etl_stage_seconds_total', 'counter', 'Wall time spent in the stage.', 'seconds'),
+            ('etl_stage_runs_total', 'counter', 'Number of times the stage ran, e.g. once per batch.', 'runs'),
+            ('etl_stage_errors_total', 'counter', 'Number of runs of the stage that failed.', 'errors'),
+            ('etl_stage_rows_in_total', 'counter', 'Rows passed to the stage.', 'rows_in'),
+            ('etl_stage_rows_out_total', 'counter', 'Rows produced by the stage.', 'rows_out'),
+            ('etl_stage_bytes_total', 'counter', 'Bytes downloaded (extract), written to file (save) or sent with COPY (upload).', 'bytes'),
+            ('etl_stage_peak_memory_bytes', 'gauge', 'Peak resident memory of the process while the stage ran.', 'peak_memory_bytes')
+        ]
+        totals = self.totals()
+        lines = []
+        for name, metric_type, description, key in metrics:
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} {metric_type}"]
+            for (source, stage), total in totals.items():
+                lines.append(f'{name}{{source="{source}",stage="{stage}"}} {total[key]}')
+        lines += ['# HELP etl_rows_dropped_total Rows rejected by each validation rule.',
+                  '# TYPE etl_rows_dropped_total counter']
+        for (source, stage), total in totals.items():
+            for rule, count in total['rows_dropped'].items():
+                lines.append(f'etl_rows_dropped_total{{source="{source}",stage="{stage}",rule="{rule}"}} {count}')
+
+        temporary_file = f"{file_name}.tmp"
+        with open(temporary_file, 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+        os.replace(temporary_file, file_name)
+
+    def print_summary(self):
+        """
+        Prints the totals per source and stage, slowest first.
+        """
+        totals = sorted(self.totals().items(), key=lambda item: item[1]['seconds'], reverse=True)
+        print("Stage metrics (slowest first):")
+        for (source, stage), total in totals:
+            dropped = sum(total['rows_dropped'].values())
+            print(f"  {source:12s} {stage:8s} {total['seconds']:8.2f} s  {total['rows_in']:>10} rows in  "
+                  f"{total['rows_out']:>10} rows out  {dropped:>8} dropped by rules  "
+                  f"peak {total['peak_memory_bytes'] / 1024 ** 2:,.0f} MiB")
+
+
+if __name__ == '__main__':
+    pass
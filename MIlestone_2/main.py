@@ -1,103 +1,464 @@
 from database_utils import DatabaseConnector
 from data_extraction import DataExtractor
 from data_cleaning import DataCleaning
+from checkpoint import Checkpointer
+from extraction_cache import ExtractionCache
+from pipeline import PipelineScheduler
+from sales_aggregates import SalesAggregator
+from instrumentation import PipelineMetrics
+from sharded_cleaning import ShardedCleaner
+from output_sinks import SINKS
+from functools import partial
+import pandas as pd
 from config import pdf_link, API_KEY, number_of_stores_url, store_url_template, s3_products_address, s3_sale_dates_address
 
-def extract_and_clean_rds_data(db_connector, data_extractor, table_name, clean_func, output_csv, db_table_name):
+# Number of concurrent requests used when retrieving store details from the API
+STORE_FETCH_WORKERS = 16
+
+# Number of worker processes reading page ranges of the card details PDF (1 reads it in a single call)
+PDF_WORKERS = 4
+
+# Number of rows read, cleaned and uploaded at a time when streaming RDS tables
+RDS_CHUNKSIZE = 50000
+
+# Stream the products CSV from S3 in batches of PRODUCT_CHUNKSIZE rows, cleaning and uploading each batch
+# as it arrives, so memory use is bounded by the batch size. Streaming bypasses the extraction cache.
+STREAM_PRODUCTS = False
+PRODUCT_CHUNKSIZE = 100000
+
+# Debug snapshots of the cleaning steps. Set CHECKPOINTS_ENABLED to True to record row counts and timings,
+# and list step names in CHECKPOINT_STEPS to only write those snapshots (None writes every step).
+CHECKPOINTS_ENABLED = False
+CHECKPOINT_STEPS = None
+
+# Convert cleaned data to compact column types (categories, Arrow strings, small integers) to cut memory use;
+# the memory saved per cleaner is written to MEMORY_REPORT_FILE
+COMPACT_DTYPES = False
+MEMORY_REPORT_FILE = 'memory_report.json'
+
+# Number of worker processes cleaning row partitions of large frames in parallel (1 cleans each frame in
+# its pipeline thread). Frames are split into at most one partition per MIN_ROWS_PER_SHARD rows.
+# Checkpoints are not recorded for frames cleaned in partitions.
+CLEANING_WORKERS = 1
+MIN_ROWS_PER_SHARD = 500000
+
+# Format of the cleaned tables written to OUTPUT_DIR for downstream jobs: 'parquet' or 'arrow' (Arrow IPC),
+# both compressed with zstd, or 'csv'. Tables in OUTPUT_PARTITIONS are split into one directory per value of
+# the given column; orders are partitioned by the year of their sale, looked up in the saved date events.
+OUTPUT_FORMAT = 'parquet'
+OUTPUT_DIR = 'cleaned_data'
+OUTPUT_PARTITIONS = {'cleaned_orders_data': 'year', 'cleaned_date_events_data': 'year'}
+
+# On-disk cache of the parsed S3, PDF and JSON sources; unchanged sources are served from it
+USE_EXTRACTION_CACHE = True
+EXTRACTION_CACHE_DIR = 'extraction_cache'
+
+# Number of source pipelines (extract, clean, upload) run at the same time
+PIPELINE_WORKERS = 5
+
+# Incremental mode: extract only what changed since the last run and merge it into the existing tables.
+# RDS tables are tracked by their highest 'index'; S3, PDF and JSON sources by their ETag, and skipped when unchanged.
+INCREMENTAL_LOAD = False
+
+# Full loads go into unindexed staging tables. Once every table is loaded, their primary keys, foreign keys
+# and indexes are built in one pass and the staging tables replace the live ones in a single transaction.
+DEFERRED_CONSTRAINTS = True
+
+# Refresh the sales summary tables the Milestone 4 reports can be answered from (Milestone_4/aggregates) after
+# the load: rebuilt after a full load, updated with the new orders only after an incremental one
+REFRESH_SALES_AGGREGATES = True
+
+# Metrics of every extract, clean, save and upload stage: one JSON object per stage is appended to
+# METRICS_LOG_FILE, and the totals per source and stage are written to PROMETHEUS_FILE (None to skip)
+METRICS_LOG_FILE = 'pipeline_metrics.jsonl'
+PROMETHEUS_FILE = 'pipeline_metrics.prom'
+
+# Print the head and info() of every extracted and cleaned DataFrame. info() is slow on wide frames,
+# so leave this off outside debugging.
+DEBUG_DATAFRAME_DUMPS = False
+
+# Columns identifying a row of each target table (the star-schema keys), used to merge incremental loads.
+# Several orders can share a date_uuid, so orders are identified by their RDS 'index', which is also their watermark.
+TABLE_KEYS = {
+    'dim_users': ['user_uuid'],
+    'dim_card_details': ['card_number'],
+    'dim_store_details': ['store_code'],
+    'dim_products': ['product_code'],
+    'dim_date_times': ['date_uuid'],
+    'orders_table': ['index']
+}
+
+def upload_table(db_connector, data_frame, db_table_name, first_batch=True):
+    """
+    Uploads cleaned data: merged on the table's keys in incremental mode, otherwise replacing the
+    table with the first batch and appending any further batches (into its staging table with
+    DEFERRED_CONSTRAINTS).
+
+    :param db_connector: Instance of DatabaseConnector for database operations.
+    :param data_frame: Cleaned DataFrame to upload.
+    :param db_table_name: Name of the table to upload the data to.
+    :param first_batch: Whether this is the first batch of the table in this run.
+    """
+    if INCREMENTAL_LOAD:
+        db_connector.upsert_to_db(data_frame, db_table_name, TABLE_KEYS[db_table_name])
+    else:
+        db_connector.upload_to_db(data_frame, db_table_name, if_exists='replace' if first_batch else 'append',
+                                  staged=DEFERRED_CONSTRAINTS)
+
+def is_unchanged_source(db_connector, source, version):
+    """
+    Checks, in incremental mode, whether a source still has the version that was last loaded.
+
+    :param db_connector: Instance of DatabaseConnector for database operations.
+    :param source: Name of the source.
+    :param version: Current version of the source, e.g. its ETag. None means it cannot be tracked.
+    :return: True if the source can be skipped.
+    """
+    if not INCREMENTAL_LOAD or version is None:
+        return False
+    if db_connector.get_watermark(source) == version:
+        print(f"{source} unchanged since the last load, skipping")
+        return True
+    return False
+
+def debug_dump(label, data_frame):
+    """
+    Prints the head and column summary of a DataFrame when DEBUG_DATAFRAME_DUMPS is enabled.
+
+    :param label: Description of the DataFrame, e.g. 'Extracted card data'.
+    :param data_frame: DataFrame to show.
+    """
+    if not DEBUG_DATAFRAME_DUMPS:
+        return
+    print(f"{label} head:\n", data_frame.head())
+    data_frame.info()
+
+def extract_stage(metrics, data_extractor, source, extract, address=None):
+    """
+    Extracts a source, recording the rows and the bytes downloaded.
+
+    :param metrics: Instance of PipelineMetrics recording the stage.
+    :param data_extractor: Instance of DataExtractor for data extraction.
+    :param source: Name of the source.
+    :param extract: Function without arguments returning the extracted DataFrame, or None when a stream is exhausted.
+    :param address: Address the source is downloaded from, to count its bytes. None for RDS tables.
+    :return: The extracted DataFrame.
+    """
+    with metrics.stage(source, 'extract') as record:
+        bytes_before = data_extractor.bytes_received.get(address, 0)
+        data_frame = extract()
+        record['rows_out'] = 0 if data_frame is None else len(data_frame)
+        if address is not None:
+            record['bytes'] = data_extractor.bytes_received.get(address, 0) - bytes_before
+    if data_frame is not None:
+        debug_dump(f"Extracted {source} data", data_frame)
+    return data_frame
+
+def clean_stage(metrics, cleaner, source, clean_method, data_frame, date_formats=None):
+    """
+    Cleans extracted data, recording the rows kept and the rows each validation rule dropped.
+
+    :param metrics: Instance of PipelineMetrics recording the stage.
+    :param cleaner: Instance of ShardedCleaner for data cleaning.
+    :param source: Name of the source.
+    :param clean_method: Name of the cleaning method of the DataCleaning class, e.g. 'clean_card_data'.
+    :param data_frame: Extracted DataFrame.
+    :param date_formats: Formats to parse the date columns with, e.g. those of the first batch of a streamed table.
+    :return: The cleaned DataFrame.
+    """
+    with metrics.stage(source, 'clean', rows_in=len(data_frame)) as record:
+        with cleaner.data_cleaning.track_rejections() as rejections:
+            cleaned_data_frame = cleaner.clean(clean_method, data_frame, date_formats=date_formats)
+        record['rows_out'] = len(cleaned_data_frame)
+        record['rows_dropped'] = rejections
+    debug_dump(f"Cleaned {source} data", cleaned_data_frame)
+    return cleaned_data_frame
+
+def add_sale_year(sink, orders_df):
+    """
+    Adds the year of each order's sale, looked up by date_uuid in the saved date events, so the
+    orders output can be partitioned by year. Orders without a saved date event get no year.
+
+    :param sink: OutputSink the date events were saved with.
+    :param orders_df: Cleaned orders DataFrame.
+    :return: Copy of the orders DataFrame with a 'year' column.
+    """
+    try:
+        date_events_df = sink.read('cleaned_date_events_data', columns=['date_uuid', 'year'])
+    except FileNotFoundError:
+        print("No saved date events to look up the year of the orders in")
+        return orders_df.assign(year=pd.Series(pd.NA, index=orders_df.index, dtype='Int16'))
+    years = date_events_df.drop_duplicates('date_uuid').set_index('date_uuid')['year']
+    return orders_df.assign(year=orders_df['date_uuid'].map(years).astype('Int16'))
+
+def save_stage(metrics, sink, source, data_frame, output_name, first_batch=True):
+    """
+    Saves cleaned data for downstream jobs, replacing the previous run's output with the first batch.
+
+    :param metrics: Instance of PipelineMetrics recording the stage.
+    :param sink: OutputSink writing the files.
+    :param source: Name of the source.
+    :param data_frame: Cleaned DataFrame.
+    :param output_name: Name of the output table, e.g. 'cleaned_card_data'.
+    :param first_batch: Whether this is the first batch of the source in this run.
+    """
+    with metrics.stage(source, 'save', rows_in=len(data_frame)) as record:
+        partition_column = sink.partition_by.get(output_name)
+        if partition_column == 'year' and 'year' not in data_frame.columns:
+            data_frame = add_sale_year(sink, data_frame)
+        record['bytes'] = sink.write(output_name, data_frame, first_batch)
+        record['rows_out'] = len(data_frame)
+
+def upload_stage(metrics, db_connector, source, data_frame, db_table_name, first_batch=True):
+    """
+    Uploads cleaned data with upload_table, recording the bytes sent with COPY.
+
+    :param metrics: Instance of PipelineMetrics recording the stage.
+    :param db_connector: Instance of DatabaseConnector for database operations.
+    :param source: Name of the source.
+    :param data_frame: Cleaned DataFrame to upload.
+    :param db_table_name: Name of the table to upload the data to.
+    :param first_batch: Whether this is the first batch of the table in this run.
     """
-    Extracts and cleans data from a specified table, saves it to a CSV file, and uploads it to the database.
+    with metrics.stage(source, 'upload', rows_in=len(data_frame)) as record:
+        record['bytes'] = upload_table(db_connector, data_frame, db_table_name, first_batch)
+        record['rows_out'] = len(data_frame)
+
+def extract_and_clean_rds_data(db_connector, data_extractor, cleaner, sink, metrics, source, table_name, clean_method, output_name, db_table_name):
+    """
+    Extracts and cleans data from a specified table, saves it with the output sink, and uploads it to the database.
+
+    The table is streamed in batches of RDS_CHUNKSIZE rows; each batch is cleaned, saved
+    and uploaded before the next one is read, so memory use does not grow with the table size.
 
     :param db_connector: Instance of DatabaseConnector for database operations.
     :param data_extractor: Instance of DataExtractor for data extraction.
+    :param cleaner: Instance of ShardedCleaner for data cleaning.
+    :param sink: OutputSink saving the cleaned data.
+    :param metrics: Instance of PipelineMetrics recording the stages of every batch.
+    :param source: Name of the source in the metrics.
     :param table_name: Name of the table to extract data from.
-    :param clean_func: Cleaning function from the DataCleaning class.
-    :param output_csv: Name of the output CSV file.
+    :param clean_method: Name of the cleaning method of the DataCleaning class.
+    :param output_name: Name of the output table.
     :param db_table_name: Name of the table to upload cleaned data to.
     """
-    # Read the data from the specified table
-    data_df = data_extractor.read_rds_table(db_connector, table_name)
-    print(f"{table_name} data extracted successfully")
-    print("Extracted DataFrame head:\n", data_df.head())
-    data_df.info()
+    watermark = None
+    if INCREMENTAL_LOAD:
+        watermark = db_connector.get_watermark(table_name)
+        watermark = int(watermark) if watermark is not None else None
+        print(f"Loading {table_name} rows with index above {watermark}")
 
-    # Clean the extracted data
-    cleaned_data_df = clean_func(data_df)
-    print(f"{table_name} data cleaned successfully")
-    print("Cleaned DataFrame head:\n", cleaned_data_df.head())
-    cleaned_data_df.info()
+    total_rows = 0
+    batches = data_extractor.stream_rds_table(db_connector, table_name, RDS_CHUNKSIZE, watermark_column='index', watermark=watermark)
+    batch_number = 0
+    date_formats = None
+    while True:
+        # Reading the next batch is timed as the extract stage of that batch
+        data_df = extract_stage(metrics, data_extractor, source, partial(next, batches, None))
+        if data_df is None:
+            break
+        first_batch = batch_number == 0
+        if first_batch:
+            # Every batch is parsed with the date formats of the first one, so the result does not depend on batch boundaries
+            date_formats = cleaner.infer_date_formats(clean_method, data_df)
+        batch_watermark = data_df['index'].max()
+        if pd.notna(batch_watermark):
+            watermark = batch_watermark if watermark is None else max(watermark, batch_watermark)
 
-    # Save the cleaned data to a CSV file
-    cleaned_data_df.to_csv(output_csv, index=False)
+        cleaned_data_df = clean_stage(metrics, cleaner, source, clean_method, data_df, date_formats)
+        # Incremental runs only read the rows added since the watermark, so they are added to the saved output
+        save_stage(metrics, sink, source, cleaned_data_df, output_name, first_batch and not INCREMENTAL_LOAD)
+        upload_stage(metrics, db_connector, source, cleaned_data_df, db_table_name, first_batch)
+        total_rows += len(cleaned_data_df)
+        batch_number += 1
+        print(f"{table_name} batch {batch_number}: {len(data_df)} rows extracted, {len(cleaned_data_df)} rows cleaned and uploaded")
 
-    # Upload the cleaned data to the specified table
-    db_connector.upload_to_db(cleaned_data_df, db_table_name)
-    print(f"Cleaned {table_name} data uploaded successfully to '{db_table_name}' table")
+        # Batches arrive in index order, so everything up to the highest index read so far is loaded
+        if INCREMENTAL_LOAD and watermark is not None:
+            db_connector.set_watermark(table_name, int(watermark))
 
-def main():
-    """
-    Main function to orchestrate the ETL process for user data, card data, store data, product data, orders data, and date events data.
+    print(f"Cleaned {table_name} data uploaded successfully to '{db_table_name}' table ({total_rows} rows)")
+
+def load_card_data(db_connector, data_extractor, cleaner, sink, metrics):
     """
-    # Initialize the necessary classes
-    db_connector = DatabaseConnector()
-    data_extractor = DataExtractor()
-    data_cleaning = DataCleaning()
+    Extracts card details from the PDF, cleans them and uploads them to 'dim_card_details'.
 
-    # Extract and clean user data
-    extract_and_clean_rds_data(db_connector, data_extractor, 'legacy_users', data_cleaning.clean_user_data, "cleaned_user_data.csv", 'dim_users')
+    :param db_connector: Instance of DatabaseConnector for database operations.
+    :param data_extractor: Instance of DataExtractor for data extraction.
+    :param cleaner: Instance of ShardedCleaner for data cleaning.
+    :param sink: OutputSink saving the cleaned data.
+    :param metrics: Instance of PipelineMetrics recording the stages.
+    """
+    version = data_extractor.get_url_etag(pdf_link) if INCREMENTAL_LOAD else None
+    if is_unchanged_source(db_connector, 'card_details', version):
+        return
 
-    # Extract and clean card details from PDF
-    card_data_df = data_extractor.retrieve_pdf_data(pdf_link)
+    card_data_df = extract_stage(metrics, data_extractor, 'cards',
+                                 partial(data_extractor.retrieve_pdf_data, pdf_link, max_workers=PDF_WORKERS), pdf_link)
     print("Card data extracted successfully")
-    print("Extracted Card DataFrame head:\n", card_data_df.head())
-    card_data_df.info()
 
-    cleaned_card_data_df = data_cleaning.clean_card_data(card_data_df)
+    cleaned_card_data_df = clean_stage(metrics, cleaner, 'cards', 'clean_card_data', card_data_df)
     print("Card data cleaned successfully")
-    print("Cleaned Card DataFrame head:\n", cleaned_card_data_df.head())
-    cleaned_card_data_df.info()
-    cleaned_card_data_df.to_csv("cleaned_card_data.csv", index=False)
-    db_connector.upload_to_db(cleaned_card_data_df, 'dim_card_details')
+    save_stage(metrics, sink, 'cards', cleaned_card_data_df, 'cleaned_card_data')
+    upload_stage(metrics, db_connector, 'cards', cleaned_card_data_df, 'dim_card_details')
     print("Cleaned card data uploaded successfully to 'dim_card_details' table")
+    if version is not None:
+        db_connector.set_watermark('card_details', version)
 
-    # Extract and clean store details
+def load_store_data(db_connector, data_extractor, cleaner, sink, metrics):
+    """
+    Retrieves store details from the API, cleans them and uploads them to 'dim_store_details'.
+
+    :param db_connector: Instance of DatabaseConnector for database operations.
+    :param data_extractor: Instance of DataExtractor for data extraction.
+    :param cleaner: Instance of ShardedCleaner for data cleaning.
+    :param sink: OutputSink saving the cleaned data.
+    :param metrics: Instance of PipelineMetrics recording the stages.
+    """
     headers = {"x-api-key": API_KEY}
     number_of_stores = data_extractor.list_number_of_stores(number_of_stores_url, headers)
     print(f"Number of stores: {number_of_stores}")
-    stores_df = data_extractor.retrieve_stores_data(store_url_template, headers, number_of_stores)
+    stores_df = extract_stage(metrics, data_extractor, 'stores', partial(
+        data_extractor.retrieve_stores_data, store_url_template, headers, number_of_stores, max_workers=STORE_FETCH_WORKERS),
+        store_url_template)
     if not stores_df.empty:
         print("Stores data extracted successfully")
-        stores_df.info()
-        cleaned_stores_df = data_cleaning.clean_store_data(stores_df)
+        cleaned_stores_df = clean_stage(metrics, cleaner, 'stores', 'clean_store_data', stores_df)
         print("Store data cleaned successfully")
-        cleaned_stores_df.info()
-        cleaned_stores_df.to_csv("cleaned_stores_data.csv", index=False)
-        db_connector.upload_to_db(cleaned_stores_df, 'dim_store_details')
+        save_stage(metrics, sink, 'stores', cleaned_stores_df, 'cleaned_stores_data')
+        upload_stage(metrics, db_connector, 'stores', cleaned_stores_df, 'dim_store_details')
         print("Cleaned store data uploaded successfully to 'dim_store_details' table")
     else:
         print("Failed to create DataFrame from stores data.")
 
-    # Extract and clean product details
-    product_data_df = data_extractor.extract_from_s3(s3_products_address)
+def load_product_data(db_connector, data_extractor, cleaner, sink, metrics):
+    """
+    Downloads product details from S3, cleans them and uploads them to 'dim_products'.
+    With STREAM_PRODUCTS the file is processed in batches of PRODUCT_CHUNKSIZE rows.
+
+    :param db_connector: Instance of DatabaseConnector for database operations.
+    :param data_extractor: Instance of DataExtractor for data extraction.
+    :param cleaner: Instance of ShardedCleaner for data cleaning.
+    :param sink: OutputSink saving the cleaned data.
+    :param metrics: Instance of PipelineMetrics recording the stages.
+    """
+    version = data_extractor.get_s3_etag(s3_products_address) if INCREMENTAL_LOAD else None
+    if is_unchanged_source(db_connector, 'products', version):
+        return
+
+    if STREAM_PRODUCTS:
+        total_rows = 0
+        batches = data_extractor.stream_from_s3(s3_products_address, PRODUCT_CHUNKSIZE)
+        batch_number = 0
+        date_formats = None
+        while True:
+            # The download starts with the first batch, so its extract stage counts the object's bytes
+            product_data_df = extract_stage(metrics, data_extractor, 'products', partial(next, batches, None), s3_products_address)
+            if product_data_df is None:
+                break
+            first_batch = batch_number == 0
+            if first_batch:
+                # Every batch is parsed with the date formats of the first one
+                date_formats = cleaner.infer_date_formats('clean_product_data', product_data_df)
+            cleaned_product_data_df = clean_stage(metrics, cleaner, 'products', 'clean_product_data', product_data_df, date_formats)
+            save_stage(metrics, sink, 'products', cleaned_product_data_df, 'cleaned_product_data', first_batch)
+            upload_stage(metrics, db_connector, 'products', cleaned_product_data_df, 'dim_products', first_batch)
+            total_rows += len(cleaned_product_data_df)
+            batch_number += 1
+            print(f"Product batch {batch_number}: {len(product_data_df)} rows extracted, {len(cleaned_product_data_df)} rows cleaned and uploaded")
+        print(f"Cleaned product data uploaded successfully to 'dim_products' table ({total_rows} rows)")
+        if version is not None:
+            db_connector.set_watermark('products', version)
+        return
+
+    product_data_df = extract_stage(metrics, data_extractor, 'products',
+                                    partial(data_extractor.extract_from_s3, s3_products_address), s3_products_address)
     print("Product data extracted successfully")
-    print("Extracted Product DataFrame head:\n", product_data_df.head())
-    product_data_df.info()
-    converted_product_weights_df = data_cleaning.clean_product_data(product_data_df)
+    converted_product_weights_df = clean_stage(metrics, cleaner, 'products', 'clean_product_data', product_data_df)
     print("Converted product weights successfully")
-    print("Converted Product DataFrame head:\n", converted_product_weights_df.head())
-    converted_product_weights_df.info()
-    converted_product_weights_df.to_csv("cleaned_product_data.csv", index=False)
-    db_connector.upload_to_db(converted_product_weights_df, 'dim_products')
+    save_stage(metrics, sink, 'products', converted_product_weights_df, 'cleaned_product_data')
+    upload_stage(metrics, db_connector, 'products', converted_product_weights_df, 'dim_products')
     print("Cleaned product data uploaded successfully to 'dim_products' table")
+    if version is not None:
+        db_connector.set_watermark('products', version)
+
+def load_date_events_data(db_connector, data_extractor, cleaner, sink, metrics):
+    """
+    Downloads the sale date events JSON, cleans it and uploads it to 'dim_date_times'.
 
-    # Extract and clean orders data
-    extract_and_clean_rds_data(db_connector, data_extractor, 'orders_table', data_cleaning.clean_orders_data, "cleaned_orders_data.csv", 'orders_table')
+    :param db_connector: Instance of DatabaseConnector for database operations.
+    :param data_extractor: Instance of DataExtractor for data extraction.
+    :param cleaner: Instance of ShardedCleaner for data cleaning.
+    :param sink: OutputSink saving the cleaned data.
+    :param metrics: Instance of PipelineMetrics recording the stages.
+    """
+    version = data_extractor.get_url_etag(s3_sale_dates_address) if INCREMENTAL_LOAD else None
+    if is_unchanged_source(db_connector, 'date_events', version):
+        return
 
-    # Extract and clean date events data
-    date_events_df = data_extractor.extract_json_from_url(s3_sale_dates_address)
-    cleaned_date_events_df = data_cleaning.clean_date_events_data(date_events_df)
-    cleaned_date_events_df.to_csv("cleaned_date_events_df.csv", index=False)
-    db_connector.upload_to_db(cleaned_date_events_df, 'dim_date_times')
+    date_events_df = extract_stage(metrics, data_extractor, 'date_events',
+                                   partial(data_extractor.extract_json_from_url, s3_sale_dates_address), s3_sale_dates_address)
+    cleaned_date_events_df = clean_stage(metrics, cleaner, 'date_events', 'clean_date_events_data', date_events_df)
+    save_stage(metrics, sink, 'date_events', cleaned_date_events_df, 'cleaned_date_events_data')
+    upload_stage(metrics, db_connector, 'date_events', cleaned_date_events_df, 'dim_date_times')
     print("Cleaned date events data uploaded successfully to 'dim_date_times' table")
+    if version is not None:
+        db_connector.set_watermark('date_events', version)
+
+def main():
+    """
+    Main function to orchestrate the ETL process for user data, card data, store data, product data, orders data, and date events data.
+
+    The five dimension tables are independent and load concurrently; the orders fact table is
+    loaded once all of them have finished, as its foreign keys reference them. With
+    DEFERRED_CONSTRAINTS the six tables are published together after all of them have loaded.
+    """
+    # Initialize the necessary classes
+    db_connector = DatabaseConnector()
+    data_extractor = DataExtractor(ExtractionCache(EXTRACTION_CACHE_DIR) if USE_EXTRACTION_CACHE else None)
+    checkpointer = Checkpointer(enabled=CHECKPOINTS_ENABLED, steps=CHECKPOINT_STEPS)
+    data_cleaning = DataCleaning(checkpointer, compact_dtypes=COMPACT_DTYPES)
+    cleaner = ShardedCleaner(data_cleaning, max_workers=CLEANING_WORKERS, min_rows_per_shard=MIN_ROWS_PER_SHARD)
+    sink = SINKS[OUTPUT_FORMAT](OUTPUT_DIR, partition_by=OUTPUT_PARTITIONS)
+    metrics = PipelineMetrics(METRICS_LOG_FILE, PROMETHEUS_FILE)
+
+    scheduler = PipelineScheduler()
+    scheduler.add_stage('users', partial(
+        extract_and_clean_rds_data, db_connector, data_extractor, cleaner, sink, metrics, 'users',
+        'legacy_users', 'clean_user_data', 'cleaned_user_data', 'dim_users'))
+    scheduler.add_stage('cards', partial(load_card_data, db_connector, data_extractor, cleaner, sink, metrics))
+    scheduler.add_stage('stores', partial(load_store_data, db_connector, data_extractor, cleaner, sink, metrics))
+    scheduler.add_stage('products', partial(load_product_data, db_connector, data_extractor, cleaner, sink, metrics))
+    scheduler.add_stage('date_events', partial(load_date_events_data, db_connector, data_extractor, cleaner, sink, metrics))
+    scheduler.add_stage('orders', partial(
+        extract_and_clean_rds_data, db_connector, data_extractor, cleaner, sink, metrics, 'orders',
+        'orders_table', 'clean_orders_data', 'cleaned_orders_data', 'orders_table'),
+        depends_on=['users', 'cards', 'stores', 'products', 'date_events'])
+
+    try:
+        scheduler.run(max_workers=PIPELINE_WORKERS)
+        if DEFERRED_CONSTRAINTS and not INCREMENTAL_LOAD:
+            # Sources that loaded nothing (e.g. no stores retrieved) leave their live tables in place
+            staged_tables = [table for table in TABLE_KEYS if table in db_connector.staged_tables]
+            not_staged = [table for table in TABLE_KEYS if table not in staged_tables]
+            if not_staged:
+                print(f"No data loaded for {not_staged}; keeping their current tables")
+            with metrics.stage('star_schema', 'publish'):
+                db_connector.publish_staged_tables(staged_tables)
+        if REFRESH_SALES_AGGREGATES:
+            with metrics.stage('sales_aggregates', 'refresh'):
+                SalesAggregator(db_connector).refresh(full=not INCREMENTAL_LOAD)
+    finally:
+        # Close the pooled database connections and the cleaning worker processes
+        db_connector.dispose()
+        cleaner.close()
+        checkpointer.write_report()
+        data_cleaning.write_memory_report(MEMORY_REPORT_FILE)
+        metrics.write_prometheus()
+        metrics.print_summary()
+        print("Rows rejected by validation rule:")
+        for rule, count in data_cleaning.rejection_counts.items():
+            print(f"  {rule}: {count}")
 
 if __name__ == "__main__":
     main()
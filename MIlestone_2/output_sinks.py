@@ -0,0 +1,238 @@
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from pyarrow import fs
+
+
+def write_parquet(df: pd.DataFrame, path: str, compression: Optional[str] = 'zstd', index: Optional[bool] = None):
+    """
+    Writes a DataFrame to a Parquet file, storing mixed-type object columns as strings (missing
+    values stay missing).
+
+    :param df: DataFrame to write.
+    :param path: Path of the Parquet file.
+    :param compression: Compression codec, e.g. 'zstd', or None.
+    :param index: Whether the index is written, as in DataFrame.to_parquet.
+    """
+    try:
+        df.to_parquet(path, compression=compression, index=index)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Raw extracts can mix strings and numbers in one column, which Arrow cannot store
+        df = df.copy()
+        for column in df.select_dtypes(include='object').columns:
+            df[column] = df[column].where(df[column].isna(), df[column].astype(str))
+        df.to_parquet(path, compression=compression, index=index)
+
+
+class OutputSink:
+    def __init__(self, output_dir: str = 'cleaned_data', partition_by: Optional[dict] = None):
+        """
+        Writes the cleaned tables to files that downstream jobs read. Subclasses implement one file
+        format; every sink writes a table in batches, replacing the previous run's output with the
+        first batch, and reads it back as a DataFrame.
+
+        :param output_dir: Directory the tables are written to.
+        :param partition_by: Dictionary of table names and the column their files are split by,
+            e.g. {'cleaned_orders_data': 'year'}. Sinks that cannot partition ignore it.
+        """
+        self.output_dir = output_dir
+        self.partition_by = partition_by or {}
+        os.makedirs(output_dir, exist_ok=True)
+
+    def path(self, name: str) -> str:
+        """
+        Returns the path of a table's file or directory.
+
+        :param name: Name of the table, e.g. 'cleaned_card_data'.
+        :return: Path in output_dir.
+        """
+        raise NotImplementedError
+
+    def write(self, name: str, df: pd.DataFrame, first_batch: bool = True) -> int:
+        """
+        Writes a batch of a table.
+
+        :param name: Name of the table.
+        :param df: Batch to write.
+        :param first_batch: Whether this batch replaces the old output. Later batches, and the batches of
+            an incremental run, are added to it.
+        :return: Number of bytes written.
+        """
+        raise NotImplementedError
+
+    def read(self, name: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Reads a table written by write.
+
+        :param name: Name of the table.
+        :param columns: Columns to read. Defaults to all.
+        :return: The table.
+        """
+        raise NotImplementedError
+
+
+class CsvSink(OutputSink):
+    def __init__(self, output_dir: str = 'cleaned_data', partition_by: Optional[dict] = None):
+        """
+        Writes each table to one uncompressed CSV file. Batches are appended to the file; the header
+        is only written with the first batch. Column types are not stored, and tables are not partitioned.
+
+        :param output_dir: Directory the CSV files are written to.
+        :param partition_by: Ignored, CSV files are not partitioned.
+        """
+        super().__init__(output_dir)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.output_dir, f"{name}.csv")
+
+    def write(self, name: str, df: pd.DataFrame, first_batch: bool = True) -> int:
+        path = self.path(name)
+        size_before = 0 if first_batch or not os.path.exists(path) else os.path.getsize(path)
+        df.to_csv(path, index=False, mode='w' if first_batch else 'a', header=first_batch)
+        return os.path.getsize(path) - size_before
+
+    def read(self, name: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        return pd.read_csv(self.path(name), usecols=columns)
+
+
+class DatasetSink(OutputSink):
+    # File format of pyarrow.dataset, set by the subclasses
+    file_format = None
+    extension = None
+
+    def __init__(self, output_dir: str = 'cleaned_data', partition_by: Optional[dict] = None,
+                 compression: Optional[str] = 'zstd', memory_map: bool = True):
+        """
+        Writes each table as a directory of compressed columnar files, which keep the column types.
+        Every batch is written to new files, and partitioned tables get one subdirectory per value
+        of their partition column (e.g. year=2019/), so readers filtering on it skip the other files.
+
+        :param output_dir: Directory the tables are written to.
+        :param partition_by: Dictionary of table names and the column their files are split by.
+        :param compression: Compression codec, e.g. 'zstd', or None.
+        :param memory_map: Whether read and read_table memory-map the files instead of reading
+            them into memory, so readers of a few columns only touch the pages of those columns.
+        """
+        super().__init__(output_dir, partition_by)
+        self.compression = compression
+        self.memory_map = memory_map
+        self._batches = {}
+        self._lock = threading.Lock()
+        # Part files are named after the run, so batches appended to an earlier run's output do not replace
+        # its files, and are read after them
+        self._run_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.output_dir, name)
+
+    def _write_options(self) -> ds.FileWriteOptions:
+        raise NotImplementedError
+
+    def write(self, name: str, df: pd.DataFrame, first_batch: bool = True) -> int:
+        path = self.path(name)
+        with self._lock:
+            if first_batch:
+                shutil.rmtree(path, ignore_errors=True)
+                self._batches[name] = 0
+            batch_number = self._batches.get(name, 0)
+            self._batches[name] = batch_number + 1
+
+        written_files = []
+        partition_column = self.partition_by.get(name)
+        ds.write_dataset(
+            pa.Table.from_pandas(df, preserve_index=False), path, format=self.file_format,
+            file_options=self._write_options(),
+            partitioning=[partition_column] if partition_column else None, partitioning_flavor='hive',
+            # Batches write files with their own names next to the earlier batches' files
+            basename_template=f"part-{self._run_id}-{batch_number:05d}-{{i}}.{self.extension}",
+            existing_data_behavior='overwrite_or_ignore',
+            file_visitor=lambda written_file: written_files.append(written_file.path))
+        return sum(os.path.getsize(written_file) for written_file in written_files)
+
+    def dataset(self, name: str) -> ds.Dataset:
+        """
+        Opens a table written by write, without reading it.
+
+        :param name: Name of the table.
+        :return: The table's dataset, e.g. to scan it in batches or with a filter on the partition column.
+        """
+        path = self.path(name)
+        if not os.path.isdir(path):
+            raise FileNotFoundError(f"No output written for '{name}' in {self.output_dir}")
+        return ds.dataset(path, format=self.file_format, partitioning='hive',
+                          filesystem=fs.LocalFileSystem(use_mmap=self.memory_map))
+
+    def read_table(self, name: str, columns: Optional[List[str]] = None, filter: Optional[ds.Expression] = None) -> pa.Table:
+        """
+        Reads a table as an Arrow table. Uncompressed Arrow files are read without copying them
+        out of the memory map.
+
+        :param name: Name of the table.
+        :param columns: Columns to read. Defaults to all.
+        :param filter: Row filter, e.g. ds.field('year') == 2019 to only read that year's files.
+        :return: The Arrow table.
+        """
+        return self.dataset(name).to_table(columns=columns, filter=filter)
+
+    def read(self, name: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        dataset = self.dataset(name)
+        table = dataset.to_table(columns=columns)
+        metadata = table.schema.pandas_metadata or {'columns': []}
+        if columns is None:
+            # Partition columns are read last; they are moved back to where they were written
+            table = table.select([column['name'] for column in metadata['columns'] if column['name'] in table.column_names]
+                                 + [column for column in table.column_names
+                                    if column not in {column['name'] for column in metadata['columns']}])
+        df = table.to_pandas()
+
+        # The types of partition columns are inferred from the directory names (e.g. int32 for years),
+        # so they are converted back to the types they were written with
+        fragment = next(iter(dataset.get_fragments()), None)
+        partition_columns = set(df.columns) - set(fragment.physical_schema.names) if fragment is not None else set()
+        for column in metadata['columns']:
+            if column['name'] in partition_columns:
+                df[column['name']] = df[column['name']].astype(
+                    'category' if column['pandas_type'] == 'categorical' else column['numpy_type'])
+        return df
+
+
+class ParquetSink(DatasetSink):
+    """
+    Writes the tables as Parquet files, compressed with zstd by default.
+    """
+    file_format = 'parquet'
+    extension = 'parquet'
+
+    def _write_options(self) -> ds.FileWriteOptions:
+        return ds.ParquetFileFormat().make_write_options(compression=self.compression or 'none')
+
+
+class ArrowSink(DatasetSink):
+    """
+    Writes the tables as Arrow IPC (Feather v2) files, compressed with zstd by default. With
+    compression=None the files are read straight from the memory map, without decoding.
+    """
+    file_format = 'ipc'
+    extension = 'arrow'
+
+    def _write_options(self) -> ds.FileWriteOptions:
+        return ds.IpcFileFormat().make_write_options(compression=self.compression)
+
+
+# Sinks by the name OUTPUT_FORMAT in main.py refers to them with
+SINKS = {
+    'parquet': ParquetSink,
+    'arrow': ArrowSink,
+    'csv': CsvSink
+}
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,122 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable
+
+
+class PipelineScheduler:
+    def __init__(self):
+        """
+        Runs named pipeline stages concurrently while respecting the dependencies between them.
+
+        A stage starts as soon as all the stages it depends on have finished successfully. If a stage
+        fails, the stages that depend on it (directly or indirectly) are skipped.
+        """
+        self.stages = {}
+        self.dependencies = {}
+        self.stage_times = {}
+        self.errors = {}
+        self.skipped = []
+
+    def add_stage(self, name: str, func: Callable[[], None], depends_on: Iterable[str] = ()):
+        """
+        Adds a stage to the pipeline.
+
+        :param name: Unique name of the stage.
+        :param func: Callable without arguments that runs the whole stage.
+        :param depends_on: Names of the stages that must finish before this one starts.
+        """
+        if name in self.stages:
+            raise ValueError(f"Stage '{name}' has already been added.")
+        self.stages[name] = func
+        self.dependencies[name] = set(depends_on)
+
+    def _check_dependencies(self):
+        """
+        Checks that every dependency exists and that the stages do not depend on each other in a cycle.
+        """
+        for name, depends_on in self.dependencies.items():
+            unknown = depends_on - set(self.stages)
+            if unknown:
+                raise ValueError(f"Stage '{name}' depends on unknown stages: {sorted(unknown)}")
+
+        resolved = set()
+        remaining = dict(self.dependencies)
+        while remaining:
+            ready = [name for name, depends_on in remaining.items() if depends_on <= resolved]
+            if not ready:
+                raise ValueError(f"Stages have cyclic dependencies: {sorted(remaining)}")
+            resolved.update(ready)
+            for name in ready:
+                del remaining[name]
+
+    def _run_stage(self, name: str):
+        """
+        Runs a stage and records its wall time.
+
+        :param name: Name of the stage to run.
+        """
+        print(f"Stage '{name}' started")
+        start = time.perf_counter()
+        try:
+            self.stages[name]()
+        finally:
+            self.stage_times[name] = time.perf_counter() - start
+        print(f"Stage '{name}' finished in {self.stage_times[name]:.2f} s")
+
+    def run(self, max_workers: int = 4) -> Dict[str, float]:
+        """
+        Runs all stages on a thread pool.
+
+        :param max_workers: Maximum number of stages running at the same time.
+        :return: Dictionary of stage names and their wall times in seconds.
+        :raises RuntimeError: If any stage failed, after all other runnable stages have finished.
+        """
+        self._check_dependencies()
+        pending = dict(self.dependencies)
+        done = set()
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            running = {}
+            while pending or running:
+                # Skip stages whose dependencies failed or were skipped themselves
+                blocked = True
+                while blocked:
+                    blocked = [name for name, depends_on in pending.items()
+                               if depends_on & (set(self.errors) | set(self.skipped))]
+                    for name in blocked:
+                        print(f"Stage '{name}' skipped because a dependency failed")
+                        self.skipped.append(name)
+                        del pending[name]
+
+                # Start every stage whose dependencies have all finished
+                for name in [name for name, depends_on in pending.items() if depends_on <= done]:
+                    running[executor.submit(self._run_stage, name)] = name
+                    del pending[name]
+
+                if not running:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        print(f"Stage '{name}' failed: {error!r}")
+                        self.errors[name] = error
+                    else:
+                        done.add(name)
+
+        total_time = time.perf_counter() - start
+        print("Stage wall times:")
+        for name, stage_time in sorted(self.stage_times.items(), key=lambda item: item[1], reverse=True):
+            print(f"  {name}: {stage_time:.2f} s")
+        print(f"  total: {total_time:.2f} s")
+
+        if self.errors:
+            raise RuntimeError(f"Pipeline stages failed: {sorted(self.errors)}, skipped: {self.skipped}")
+        return dict(self.stage_times)
+
+
+if __name__ == '__main__':
+    pass
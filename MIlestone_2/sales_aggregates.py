@@ -0,0 +1,142 @@
+import time
+from sqlalchemy import inspect, text
+
+from database_utils import DatabaseConnector
+
+# Sales per store type, country, channel and month: answers Milestone 4 tasks 3, 4, 5, 6 and 8.
+# positive_sales only counts orders with a positive quantity and price, as task 3 does.
+SALES_SUMMARY_TABLE = 'agg_sales'
+SALES_SUMMARY_KEYS = ['store_type', 'country_code', 'location', 'year', 'month']
+SALES_SUMMARY_QUERY = """
+    SELECT
+        s.store_type,
+        s.country_code,
+        CASE WHEN s.store_code LIKE 'WEB-%' THEN 'Web' ELSE 'Offline' END AS location,
+        d.year,
+        d.month,
+        COUNT(*) AS number_of_sales,
+        SUM(o.product_quantity) AS product_quantity,
+        SUM(o.product_quantity * p.product_price) AS total_sales,
+        SUM(CASE WHEN o.product_quantity > 0 AND p.product_price > 0
+                 THEN o.product_quantity * p.product_price ELSE 0 END) AS positive_sales
+    FROM orders_table o
+    JOIN dim_store_details s ON o.store_code = s.store_code
+    JOIN dim_products p ON o.product_code = p.product_code
+    JOIN dim_date_times d ON o.date_uuid = d.date_uuid
+    WHERE {order_filter}
+    GROUP BY s.store_type, s.country_code, CASE WHEN s.store_code LIKE 'WEB-%' THEN 'Web' ELSE 'Offline' END, d.year, d.month
+"""
+
+# Number, first and last sale time per year: answers Milestone 4 task 9. The gaps between consecutive
+# sales within a year add up to the year's last sale minus the sale before its first one, so the
+# average gap follows from these columns without a window over every order.
+SALE_TIMES_TABLE = 'agg_sale_times'
+SALE_TIMES_KEYS = ['year']
+SALE_TIMES_QUERY = """
+    SELECT
+        d.year,
+        COUNT(d.timestamp) AS number_of_sales,
+        MIN(d.timestamp) AS first_sale,
+        MAX(d.timestamp) AS last_sale
+    FROM orders_table o
+    JOIN dim_date_times d ON o.date_uuid = d.date_uuid
+    JOIN dim_store_details s ON o.store_code = s.store_code
+    WHERE {order_filter}
+    GROUP BY d.year
+"""
+
+# Watermark source recording the highest orders_table index included in the summaries
+AGGREGATES_WATERMARK = 'sales_aggregates'
+
+
+class SalesAggregator:
+    def __init__(self, db_connector: DatabaseConnector):
+        """
+        Maintains summary tables of the sales in the star schema, so the Milestone 4 reports can be
+        answered from a few hundred rows instead of joining and scanning the whole orders table.
+
+        The summaries use the dimension attributes at the time each order was added. A refresh
+        after new orders only aggregates those orders; if dimension rows change (e.g. a product's
+        price), rebuild the summaries with refresh(full=True).
+
+        :param db_connector: Instance of DatabaseConnector for database operations.
+        """
+        self.db_connector = db_connector
+
+    def refresh(self, full: bool = False):
+        """
+        Brings the summary tables up to date with orders_table.
+
+        :param full: Rebuild the summaries from all orders. Otherwise only orders with an index above
+            the last refresh are added, or everything is rebuilt if the summaries don't exist yet.
+        """
+        engine = self.db_connector.get_engine('db_creds_local.yaml')
+        start = time.perf_counter()
+        watermark = None if full else self.db_connector.get_watermark(AGGREGATES_WATERMARK)
+        inspector = inspect(engine)
+        if not (inspector.has_table(SALES_SUMMARY_TABLE) and inspector.has_table(SALE_TIMES_TABLE)):
+            watermark = None
+
+        with engine.begin() as connection:
+            high = connection.execute(text('SELECT MAX("index") FROM orders_table')).scalar()
+            if high is None:
+                print("orders_table is empty, sales summaries not refreshed")
+                return
+            # Both bounds are integers read from the database, so they are written into the SQL directly
+            order_filter = f'o."index" <= {int(high)}'
+            if watermark is not None:
+                order_filter = f'o."index" > {int(watermark)} AND {order_filter}'
+
+            if watermark is None:
+                for table, query in [(SALES_SUMMARY_TABLE, SALES_SUMMARY_QUERY), (SALE_TIMES_TABLE, SALE_TIMES_QUERY)]:
+                    connection.execute(text(f'DROP TABLE IF EXISTS "{table}"'))
+                    connection.execute(text(f'CREATE TABLE "{table}" AS {query.format(order_filter=order_filter)}'))
+            else:
+                least, greatest = ('LEAST', 'GREATEST') if engine.dialect.name == 'postgresql' else ('MIN', 'MAX')
+                self._merge(connection, SALES_SUMMARY_TABLE, SALES_SUMMARY_QUERY.format(order_filter=order_filter),
+                            SALES_SUMMARY_KEYS, {
+                                'number_of_sales': '{table}.number_of_sales + delta.number_of_sales',
+                                'product_quantity': '{table}.product_quantity + delta.product_quantity',
+                                'total_sales': '{table}.total_sales + delta.total_sales',
+                                'positive_sales': '{table}.positive_sales + delta.positive_sales'
+                            })
+                self._merge(connection, SALE_TIMES_TABLE, SALE_TIMES_QUERY.format(order_filter=order_filter),
+                            SALE_TIMES_KEYS, {
+                                'number_of_sales': '{table}.number_of_sales + delta.number_of_sales',
+                                'first_sale': f'{least}(COALESCE({{table}}.first_sale, delta.first_sale), COALESCE(delta.first_sale, {{table}}.first_sale))',
+                                'last_sale': f'{greatest}(COALESCE({{table}}.last_sale, delta.last_sale), COALESCE(delta.last_sale, {{table}}.last_sale))'
+                            })
+
+            # Recorded in the same transaction, so orders are never added to the summaries twice
+            self.db_connector.set_watermark(AGGREGATES_WATERMARK, int(high), connection)
+
+        mode = 'rebuilt' if watermark is None else f"updated with orders above index {watermark}"
+        print(f"Sales summaries {mode} in {time.perf_counter() - start:.2f} s")
+
+    def _merge(self, connection, table_name: str, delta_query: str, key_columns: list, updates: dict):
+        """
+        Adds the aggregates of new orders to a summary table: groups that already exist are
+        combined with the new values, new groups are inserted.
+
+        :param connection: Open SQLAlchemy connection; the caller controls the transaction.
+        :param table_name: The name of the summary table.
+        :param delta_query: Query aggregating the new orders.
+        :param key_columns: Columns identifying a group. They may be NULL, so they are compared with IS NOT DISTINCT FROM.
+        :param updates: Dictionary of value columns and the expressions combining them, with
+            '{table}' standing for the summary table and 'delta' for the new aggregates.
+        """
+        delta_table = f"{table_name}_delta"
+        matches = ' AND '.join(f'"{table_name}"."{column}" IS NOT DISTINCT FROM delta."{column}"' for column in key_columns)
+        assignments = ', '.join(f'"{column}" = {expression.format(table=table_name)}' for column, expression in updates.items())
+
+        connection.execute(text(f'DROP TABLE IF EXISTS "{delta_table}"'))
+        connection.execute(text(f'CREATE TEMP TABLE "{delta_table}" AS {delta_query}'))
+        connection.execute(text(f'UPDATE "{table_name}" SET {assignments} FROM "{delta_table}" delta WHERE {matches}'))
+        connection.execute(text(
+            f'INSERT INTO "{table_name}" SELECT * FROM "{delta_table}" delta '
+            f'WHERE NOT EXISTS (SELECT 1 FROM "{table_name}" WHERE {matches})'))
+        connection.execute(text(f'DROP TABLE "{delta_table}"'))
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,306 @@
+import multiprocessing
+import os
+import pickle
+import threading
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pandas.api.types import infer_dtype
+try:
+    # Public since pandas 2.2; pd.to_datetime infers a column's format with it from the first value.
+    # Without it the date formats cannot be inferred, so frames are cleaned in one process.
+    from pandas.tseries.api import guess_datetime_format
+except ImportError:
+    guess_datetime_format = None
+
+from data_cleaning import CLEANERS, DataCleaning
+
+# Values pd.to_datetime skips when it looks for the first value to infer a format from
+SKIPPED_DATE_STRINGS = {'', 'now', 'today', 'NaT', 'nat', 'NAT', 'nan', 'NaN', 'NAN'}
+
+
+def _nan_null_columns(df: pd.DataFrame) -> Optional[List[str]]:
+    """
+    Checks that a DataFrame comes back unchanged from Arrow: column names are strings, and object
+    columns only hold strings and one kind of missing value. Arrow returns missing strings as None,
+    so the object columns whose missing values are NaN are listed to be restored.
+
+    :param df: DataFrame to check.
+    :return: Names of the object columns with NaN as missing value, or None if Arrow would change the frame.
+    """
+    if not all(isinstance(column, str) for column in df.columns) or df.columns.has_duplicates:
+        return None
+
+    nan_columns = []
+    for column in df.columns:
+        values = df[column]
+        if values.dtype != object:
+            continue
+        if infer_dtype(values, skipna=True) not in ('string', 'empty'):
+            return None
+        missing = values.to_numpy()[values.isna().to_numpy()]
+        if len(missing) == 0:
+            continue
+        is_none = np.equal(missing, None)
+        if is_none.all():
+            continue
+        if is_none.any() or not all(type(value) is float for value in missing):
+            return None
+        nan_columns.append(column)
+    return nan_columns
+
+
+def _write_ipc_stream(table: pa.Table, buffer: memoryview):
+    """
+    Writes an Arrow table as an IPC stream straight into a buffer. The writer's references to the
+    buffer end with this function, so the buffer's shared memory can be closed afterwards.
+
+    :param table: Table to write.
+    :param buffer: Writable buffer of at least the stream's size.
+    """
+    sink = pa.FixedSizeBufferWriter(pa.py_buffer(buffer))
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    sink.close()
+
+
+def write_shared_frame(df: pd.DataFrame) -> dict:
+    """
+    Writes a DataFrame to a new shared memory block as an Arrow IPC stream, so another process can
+    read it without the DataFrame being pickled. Frames Arrow would change (e.g. columns mixing
+    strings and numbers) are pickled into the block instead.
+
+    :param df: DataFrame to share.
+    :return: Dictionary describing the block, to be passed to read_shared_frame.
+    """
+    nan_columns = _nan_null_columns(df)
+    table = None
+    if nan_columns is not None:
+        try:
+            table = pa.Table.from_pandas(df)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            table = None
+
+    if table is not None:
+        sizer = pa.MockOutputStream()
+        with pa.ipc.new_stream(sizer, table.schema) as writer:
+            writer.write_table(table)
+        size = sizer.size()
+        block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        _write_ipc_stream(table, block.buf)
+        data_format = 'arrow'
+    else:
+        content = pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+        size = len(content)
+        block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        block.buf[:size] = content
+        data_format = 'pickle'
+
+    descriptor = {'name': block.name, 'size': size, 'format': data_format, 'nan_columns': nan_columns}
+    block.close()
+    return descriptor
+
+
+def read_shared_frame(descriptor: dict) -> pd.DataFrame:
+    """
+    Reads a DataFrame written by write_shared_frame and frees its shared memory block.
+
+    :param descriptor: Dictionary returned by write_shared_frame.
+    :return: The DataFrame.
+    """
+    block = shared_memory.SharedMemory(name=descriptor['name'])
+    try:
+        # Copied out of the block, so the DataFrame does not point into memory that is about to be freed
+        content = bytes(block.buf[:descriptor['size']])
+    finally:
+        block.close()
+        block.unlink()
+
+    if descriptor['format'] == 'pickle':
+        return pickle.loads(content)
+
+    df = pa.ipc.open_stream(pa.py_buffer(content)).read_all().to_pandas()
+    for column in descriptor['nan_columns']:
+        df[column] = df[column].where(df[column].notna(), np.nan)
+    return df
+
+
+def free_shared_frame(descriptor: dict):
+    """
+    Frees the shared memory block of a DataFrame that will not be read, e.g. after a worker failed.
+
+    :param descriptor: Dictionary returned by write_shared_frame.
+    """
+    try:
+        block = shared_memory.SharedMemory(name=descriptor['name'])
+    except FileNotFoundError:
+        return
+    block.close()
+    block.unlink()
+
+
+def _clean_shard(method_name: str, descriptor: dict, date_formats: dict) -> Tuple[dict, dict]:
+    """
+    Cleans one row partition in a worker process.
+
+    :param method_name: Name of the DataCleaning method.
+    :param descriptor: Shared memory block of the partition.
+    :param date_formats: Date formats inferred from the whole frame.
+    :return: Tuple of the shared memory block of the cleaned partition and the rows each validation rule rejected.
+    """
+    df = read_shared_frame(descriptor)
+    data_cleaning = DataCleaning(date_formats=date_formats)
+    with warnings.catch_warnings():
+        # The cleaners assign to filtered frames; pandas' copy warnings would be repeated by every worker
+        warnings.simplefilter('ignore', pd.errors.SettingWithCopyWarning)
+        with data_cleaning.track_rejections() as rejections:
+            cleaned_df = getattr(data_cleaning, method_name)(df)
+    return write_shared_frame(cleaned_df), rejections
+
+
+class ShardedCleaner:
+    def __init__(self, data_cleaning: Optional[DataCleaning] = None, max_workers: int = 1,
+                 min_rows_per_shard: int = 100000):
+        """
+        Runs the DataCleaning methods on row partitions of a frame in a process pool, so large
+        frames are cleaned on several cores. The partitions are sent to the workers and back through
+        shared memory as Arrow IPC streams, and recombined in their original order.
+
+        The result is the same as cleaning the whole frame with data_cleaning: date formats are
+        inferred from the whole frame before it is split, and compact types are applied to the
+        recombined frame. Rejected rows are added to data_cleaning.rejection_counts; checkpoints
+        are not recorded for sharded runs.
+
+        :param data_cleaning: DataCleaning instance whose settings and counters are used. Defaults to a new one.
+        :param max_workers: Number of worker processes. 1 cleans every frame in the calling thread.
+        :param min_rows_per_shard: Frames are split into at most one partition per this many rows,
+            so small frames are not sent to the workers.
+        """
+        self.data_cleaning = data_cleaning if data_cleaning is not None else DataCleaning()
+        self.max_workers = max_workers
+        self.min_rows_per_shard = min_rows_per_shard
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """
+        Starts the process pool on first use; it is reused by later calls until close().
+        Workers are spawned rather than forked, as the pipeline calls this from several threads.
+
+        :return: The process pool.
+        """
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def close(self):
+        """
+        Shuts down the process pool.
+        """
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def clean(self, method_name: str, df: pd.DataFrame, number_of_shards: Optional[int] = None,
+              date_formats: Optional[dict] = None) -> pd.DataFrame:
+        """
+        Cleans a DataFrame with a DataCleaning method, split into row partitions cleaned in parallel.
+
+        :param method_name: Name of the method in CLEANERS, e.g. 'clean_orders_data'.
+        :param df: DataFrame to clean.
+        :param number_of_shards: Number of row partitions. Defaults to max_workers; fewer are used
+            if the frame has less than min_rows_per_shard rows per partition.
+        :param date_formats: Formats to parse the date columns with, e.g. inferred from the first batch
+            of a streamed table with infer_date_formats. Defaults to the formats of this frame.
+        :return: Cleaned DataFrame.
+        """
+        if method_name not in CLEANERS:
+            raise ValueError(f"Unknown cleaning method '{method_name}'. Choose from {list(CLEANERS)}.")
+        number_of_shards = min(number_of_shards or self.max_workers, len(df) // self.min_rows_per_shard)
+        if date_formats is None and guess_datetime_format is None:
+            # Partitions would each infer their own date formats, so the whole frame is parsed with one
+            warnings.warn("pandas has no guess_datetime_format (pandas < 2.2); cleaning in one process")
+            number_of_shards = 1
+        if self.max_workers <= 1 or number_of_shards <= 1:
+            with self.data_cleaning.use_date_formats(date_formats or {}):
+                return getattr(self.data_cleaning, method_name)(df)
+
+        compact_name, _ = CLEANERS[method_name]
+        if date_formats is None:
+            date_formats = self.infer_date_formats(method_name, df)
+        bounds = np.linspace(0, len(df), number_of_shards + 1).astype(int)
+
+        descriptors = []
+        results = []
+        try:
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                descriptors.append(write_shared_frame(df.iloc[start:end]))
+            futures = [self._get_executor().submit(_clean_shard, method_name, descriptor, date_formats)
+                       for descriptor in descriptors]
+            for future in futures:
+                results.append(future.result())
+            shards = [read_shared_frame(descriptor) for descriptor, _ in results]
+        finally:
+            # Free the blocks of partitions that were not read, e.g. because a worker failed
+            for descriptor in descriptors + [descriptor for descriptor, _ in results]:
+                free_shared_frame(descriptor)
+
+        for _, rejections in results:
+            for rule, rejected in rejections.items():
+                self.data_cleaning.count_rejections(rule, rejected)
+
+        # Empty partitions may have other dtypes (e.g. an integer column downcast differently)
+        non_empty_shards = [shard for shard in shards if len(shard)] or shards[:1]
+        cleaned_df = pd.concat(non_empty_shards)
+        return self.data_cleaning.compact(cleaned_df, compact_name)
+
+    def infer_date_formats(self, method_name: str, df: pd.DataFrame) -> dict:
+        """
+        Infers the format pd.to_datetime would use for each date column of the whole frame, so
+        partitions or later batches starting with a value in another format are parsed the same way.
+
+        :param method_name: Name of the method in CLEANERS that will clean the frame.
+        :param df: Frame to be cleaned.
+        :return: Dictionary of date columns and their formats; columns without an inferable format are
+            left out, and the dictionary is empty if this pandas version cannot infer formats.
+        """
+        _, date_columns = CLEANERS[method_name]
+        date_formats = {}
+        if guess_datetime_format is None:
+            warnings.warn("pandas has no guess_datetime_format (pandas < 2.2); each batch infers its own date formats")
+            return date_formats
+        # The store cleaner lower-cases the column names before parsing dates
+        columns = {str(column).lower(): column for column in df.columns}
+        for column in date_columns:
+            # Formats are only inferred for text; numbers, datetimes and categories are converted without one
+            if column not in columns or not (df[columns[column]].dtype == object
+                                             or isinstance(df[columns[column]].dtype, pd.StringDtype)):
+                continue
+            first_value = next((value for value in df[columns[column]].dropna()
+                                if not (isinstance(value, str) and value in SKIPPED_DATE_STRINGS)), None)
+            if type(first_value) is not str:
+                continue
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', UserWarning)
+                date_format = guess_datetime_format(first_value)
+            if date_format is not None:
+                date_formats[column] = date_format
+        return date_formats
+
+
+if __name__ == '__main__':
+    pass
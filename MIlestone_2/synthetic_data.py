@@ -0,0 +1,262 @@
+import numpy as np
+import pandas as pd
+
+# Share of generated rows replaced by rows of the string 'NULL' and by rows of random junk,
+# the two kinds of broken rows found in every source
+NULL_ROW_FRACTION = 0.001
+JUNK_ROW_FRACTION = 0.001
+
+FIRST_NAMES = np.array(['sigfried', 'Guy', 'Harry', 'Darren', 'Lea', 'Rita', 'Ana', 'Hans'])
+LAST_NAMES = np.array(['Noack', 'Allen', 'Lawrence', 'Morris', 'Fuchs', 'Cooper', 'Pérez', 'Becker'])
+COUNTRIES = np.array(['Germany', 'United Kingdom', 'United States'])
+COUNTRY_CODES = np.array(['DE', 'GB', 'US', 'gb', 'GGB'])
+CARD_PROVIDERS = np.array(['VISA 16 digit', 'Mastercard', 'JCB 16 digit', 'American Express', 'Maestro', 'Discover'])
+STORE_TYPES = np.array(['Local', 'Super Store', 'Mall Kiosk', 'Outlet'])
+CONTINENTS = np.array(['Europe', 'America', 'eeEurope', 'eeAmerica'])
+PRODUCT_CATEGORIES = np.array(['toys-and-games', 'sports-and-leisure', 'pets', 'homeware', 'health-and-beauty'])
+WEIGHT_TEMPLATES = np.array(['{}kg', '{}g', '{}ml', '12 x {}g', '{}g .', '{}oz', '{}'])
+TIME_PERIODS = np.array(['Morning', 'Midday', 'Evening', 'Late_Hours'])
+
+
+def make_uuids(start: int, number_of_rows: int, variant: int = 0) -> list:
+    """
+    Creates distinct, valid UUID strings.
+
+    :param start: Number encoded in the first UUID; the following UUIDs count up from it.
+    :param number_of_rows: Number of UUIDs.
+    :param variant: Number encoded in the last group, so different tables get different UUIDs.
+    :return: List of UUID strings.
+    """
+    return [f"{i:08x}-0000-4000-8000-{variant:012x}" for i in range(start, start + number_of_rows)]
+
+
+def random_dates(number_of_rows: int, rng: np.random.Generator, start: str = '1990-01-01', days: int = 12000) -> pd.DatetimeIndex:
+    """
+    Creates random dates.
+
+    :param number_of_rows: Number of dates.
+    :param rng: Random generator.
+    :param start: Earliest date.
+    :param days: Number of days after start the dates are spread over.
+    :return: DatetimeIndex of the dates.
+    """
+    return pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, days, number_of_rows), unit='D')
+
+
+def mixed_date_formats(dates: pd.DatetimeIndex, rng: np.random.Generator) -> np.ndarray:
+    """
+    Formats dates mostly as ISO dates, with some in the other formats found in the sources.
+
+    :param dates: Dates to format.
+    :param rng: Random generator.
+    :return: Array of date strings.
+    """
+    formatted = np.array(dates.strftime('%Y-%m-%d'), dtype=object)
+    other = rng.random(len(dates)) < 0.01
+    formatted[other] = np.array(dates[other].strftime('%Y %B %d'), dtype=object)
+    return formatted
+
+
+def inject_broken_rows(df: pd.DataFrame, rng: np.random.Generator) -> pd.DataFrame:
+    """
+    Replaces a few rows with 'NULL' strings and with random junk in every column, in place.
+
+    :param df: DataFrame of generated rows, with object columns for the values to break.
+    :param rng: Random generator.
+    :return: The same DataFrame.
+    """
+    number_of_rows = len(df)
+    rows = rng.permutation(number_of_rows)
+    null_rows = rows[:int(number_of_rows * NULL_ROW_FRACTION)]
+    junk_rows = rows[len(null_rows):len(null_rows) + int(number_of_rows * JUNK_ROW_FRACTION)]
+    characters = np.array(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'))
+    for column in [column for column in df.columns if column not in ('index', 'level_0', 'Unnamed: 0')]:
+        if df[column].dtype != object:
+            df[column] = df[column].astype(object)
+        junk = characters[rng.integers(0, len(characters), (len(junk_rows), 10))]
+        df.iloc[null_rows, df.columns.get_loc(column)] = 'NULL'
+        df.iloc[junk_rows, df.columns.get_loc(column)] = [''.join(row) for row in junk]
+    return df
+
+
+def make_legacy_users(number_of_rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Creates rows shaped like the legacy_users RDS table: lower-case names and country codes,
+    emails with stray spaces, capitals and invalid addresses, mixed date formats, and broken rows.
+
+    :param number_of_rows: Number of rows.
+    :param seed: Seed of the random generator.
+    :return: DataFrame of synthetic users.
+    """
+    rng = np.random.default_rng(seed)
+    first_names = rng.choice(FIRST_NAMES, number_of_rows)
+    emails = np.char.add(np.char.lower(first_names.astype(str)), rng.choice(['@example.com', '@MAIL.de ', '@@nope', '.invalid'], number_of_rows, p=[0.6, 0.3, 0.05, 0.05]))
+    df = pd.DataFrame({
+        'index': np.arange(number_of_rows),
+        'first_name': first_names,
+        'last_name': rng.choice(LAST_NAMES, number_of_rows),
+        'date_of_birth': mixed_date_formats(random_dates(number_of_rows, rng, '1940-01-01', 20000), rng),
+        'company': rng.choice([' Acme Ltd', 'Schmidt GmbH', 'globex inc '], number_of_rows),
+        'email_address': emails,
+        'address': rng.choice(['1 high street\nLondon', 'hauptstr. 5 ', '22 Main St'], number_of_rows),
+        'country': rng.choice(COUNTRIES, number_of_rows),
+        'country_code': rng.choice(COUNTRY_CODES, number_of_rows),
+        'phone_number': rng.choice(['+49(0)047905356', '(0161) 496 0674', '001-706-578-2476'], number_of_rows),
+        'join_date': mixed_date_formats(random_dates(number_of_rows, rng, '1992-01-01'), rng),
+        'user_uuid': make_uuids(0, number_of_rows, 1)
+    })
+    return inject_broken_rows(df, rng)
+
+
+def make_card_details(number_of_rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Creates rows shaped like the tables of the card details PDF: card numbers with leading '?',
+    invalid providers, expiry dates as MM/YY, mixed payment date formats, and broken rows.
+
+    :param number_of_rows: Number of rows.
+    :param seed: Seed of the random generator.
+    :return: DataFrame of synthetic card details.
+    """
+    rng = np.random.default_rng(seed)
+    card_numbers = (4000000000000000 + np.arange(number_of_rows) * 7919).astype(str).astype(object)
+    question_marks = rng.random(number_of_rows) < 0.01
+    card_numbers[question_marks] = '???' + card_numbers[question_marks]
+    expiry_dates = pd.Series(random_dates(number_of_rows, rng, '2022-01-01', 3000)).dt.strftime('%m/%y')
+    df = pd.DataFrame({
+        'card_number': card_numbers,
+        'expiry_date': expiry_dates.to_numpy(dtype=object),
+        'card_provider': rng.choice(CARD_PROVIDERS, number_of_rows),
+        'date_payment_confirmed': mixed_date_formats(random_dates(number_of_rows, rng, '1995-01-01'), rng)
+    })
+    return inject_broken_rows(df, rng)
+
+
+def make_store_details(number_of_rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Creates rows shaped like the store details API responses: the web portal with 'N/A'
+    coordinates, letters in staff numbers, misspelt continents, the empty 'lat' column, and broken rows.
+
+    :param number_of_rows: Number of rows.
+    :param seed: Seed of the random generator.
+    :return: DataFrame of synthetic store details.
+    """
+    rng = np.random.default_rng(seed)
+    staff_numbers = rng.integers(1, 100, number_of_rows).astype(str).astype(object)
+    lettered = rng.random(number_of_rows) < 0.01
+    staff_numbers[lettered] = 'J' + staff_numbers[lettered]
+    df = pd.DataFrame({
+        'index': np.arange(number_of_rows),
+        'address': rng.choice(['Flat 72w\nSally Isle', 'Heckerstr. 4/5', '5 Main St'], number_of_rows),
+        'longitude': rng.uniform(-120, 30, number_of_rows).round(5).astype(str).astype(object),
+        'lat': None,
+        'locality': rng.choice(['High Wycombe', 'Landshut', 'Chapletown'], number_of_rows),
+        'store_code': [f"ST-{i:08X}" for i in range(number_of_rows)],
+        'staff_numbers': staff_numbers,
+        'opening_date': mixed_date_formats(random_dates(number_of_rows, rng), rng),
+        'store_type': rng.choice(STORE_TYPES, number_of_rows),
+        'latitude': rng.uniform(-40, 60, number_of_rows).round(5).astype(str).astype(object),
+        'country_code': rng.choice(COUNTRY_CODES[:3], number_of_rows),
+        'continent': rng.choice(CONTINENTS, number_of_rows, p=[0.45, 0.45, 0.05, 0.05])
+    })
+    df.loc[0, ['address', 'longitude', 'locality', 'latitude']] = 'N/A'
+    df.loc[0, ['store_code', 'store_type']] = ['WEB-1388012W', 'Web Portal']
+    df = inject_broken_rows(df, rng)
+    # The API returns one 'NULL' store code in an otherwise valid row
+    df.loc[min(1, number_of_rows - 1), 'store_code'] = 'NULL'
+    return df
+
+
+def make_products(number_of_rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Creates rows shaped like the products CSV on S3: weights in every unit and format the parser
+    handles, '£' prices, the misspelt 'Still_avaliable', fully empty rows and broken rows.
+
+    :param number_of_rows: Number of rows.
+    :param seed: Seed of the random generator.
+    :return: DataFrame of synthetic products.
+    """
+    rng = np.random.default_rng(seed)
+    templates = WEIGHT_TEMPLATES[rng.integers(0, len(WEIGHT_TEMPLATES), number_of_rows)]
+    amounts = rng.integers(1, 1000, number_of_rows)
+    df = pd.DataFrame({
+        'Unnamed: 0': np.arange(number_of_rows),
+        'product_name': rng.choice(['FurReal Dazzlin Dimples', 'Tiny Tears Baby', 'Wooden Train Set'], number_of_rows),
+        'product_price': np.char.add('£', rng.uniform(1, 100, number_of_rows).round(2).astype(str)).astype(object),
+        'weight': [template.format(amount) for template, amount in zip(templates, amounts)],
+        'category': rng.choice(PRODUCT_CATEGORIES, number_of_rows),
+        'EAN': (10 ** 12 + np.arange(number_of_rows) * 7).astype(str).astype(object),
+        'date_added': random_dates(number_of_rows, rng, '2005-01-01', 6000).strftime('%Y-%m-%d').to_numpy(dtype=object),
+        'uuid': make_uuids(0, number_of_rows, 2),
+        'removed': rng.choice(['Still_avaliable', 'Removed'], number_of_rows),
+        'product_code': [f"P{i:09d}" for i in range(number_of_rows)]
+    })
+    df = inject_broken_rows(df, rng)
+    # Fully empty lines of the CSV
+    empty_rows = rng.choice(number_of_rows, int(number_of_rows * NULL_ROW_FRACTION), replace=False)
+    df.iloc[empty_rows, 1:] = np.nan
+    return df
+
+
+def make_orders_table(number_of_rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Creates rows shaped like the orders_table RDS table, including the 'level_0', '1' and name
+    columns the cleaner drops.
+
+    :param number_of_rows: Number of rows.
+    :param seed: Seed of the random generator.
+    :return: DataFrame of synthetic orders.
+    """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'level_0': np.arange(number_of_rows),
+        'index': np.arange(number_of_rows),
+        'date_uuid': make_uuids(0, number_of_rows, 3),
+        'first_name': None,
+        'last_name': None,
+        'user_uuid': make_uuids(0, number_of_rows, 1),
+        'card_number': 4000000000000000 + rng.integers(0, number_of_rows, number_of_rows) * 7919,
+        'store_code': [f"ST-{i:08X}" for i in rng.integers(0, max(1, number_of_rows // 1000), number_of_rows)],
+        'product_code': [f"P{i:09d}" for i in rng.integers(0, number_of_rows, number_of_rows)],
+        '1': np.nan,
+        'product_quantity': rng.integers(1, 20, number_of_rows)
+    })
+
+
+def make_date_events(number_of_rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Creates rows shaped like the sale date events JSON: date parts as strings, impossible dates
+    and broken rows.
+
+    :param number_of_rows: Number of rows.
+    :param seed: Seed of the random generator.
+    :return: DataFrame of synthetic date events.
+    """
+    rng = np.random.default_rng(seed)
+    timestamps = pd.Timestamp('1992-01-01') + pd.to_timedelta(rng.integers(0, 30 * 365 * 86400, number_of_rows), unit='s')
+    days = timestamps.day.astype(str).to_numpy(dtype=object)
+    impossible = rng.random(number_of_rows) < 0.001
+    days[impossible] = '31'
+    df = pd.DataFrame({
+        'timestamp': timestamps.strftime('%H:%M:%S').to_numpy(dtype=object),
+        'month': timestamps.month.astype(str).to_numpy(dtype=object),
+        'year': timestamps.year.astype(str).to_numpy(dtype=object),
+        'day': days,
+        'time_period': rng.choice(TIME_PERIODS, number_of_rows),
+        'date_uuid': make_uuids(0, number_of_rows, 3)
+    })
+    return inject_broken_rows(df, rng)
+
+
+# Generators of each source and the cleaner and table they feed
+SOURCES = {
+    'users': (make_legacy_users, 'clean_user_data', 'dim_users'),
+    'cards': (make_card_details, 'clean_card_data', 'dim_card_details'),
+    'stores': (make_store_details, 'clean_store_data', 'dim_store_details'),
+    'products': (make_products, 'clean_product_data', 'dim_products'),
+    'orders': (make_orders_table, 'clean_orders_data', 'orders_table'),
+    'date_events': (make_date_events, 'clean_date_events_data', 'dim_date_times')
+}
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,8 @@
+-- Task 3 answered from the agg_sales summary table (see MIlestone_2/sales_aggregates.py)
+SELECT
+    SUM(positive_sales) AS total_sales,
+    month
+FROM agg_sales
+GROUP BY month
+ORDER BY total_sales DESC
+LIMIT 6;
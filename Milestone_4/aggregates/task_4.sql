@@ -0,0 +1,8 @@
+-- Task 4 answered from the agg_sales summary table (see MIlestone_2/sales_aggregates.py)
+SELECT
+    SUM(number_of_sales)::BIGINT AS numbers_of_sales,
+    SUM(product_quantity)::BIGINT AS product_quantity_count,
+    location
+FROM agg_sales
+GROUP BY location
+ORDER BY location;
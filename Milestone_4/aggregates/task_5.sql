@@ -0,0 +1,8 @@
+-- Task 5 answered from the agg_sales summary table (see MIlestone_2/sales_aggregates.py)
+SELECT
+    store_type,
+    ROUND(SUM(total_sales)::numeric, 2) AS total_sales,
+    ROUND((SUM(number_of_sales)::numeric / SUM(SUM(number_of_sales)) OVER ()) * 100, 2) AS sale_percentage
+FROM agg_sales
+GROUP BY store_type
+ORDER BY sale_percentage DESC;
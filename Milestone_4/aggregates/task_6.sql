@@ -0,0 +1,9 @@
+-- Task 6 answered from the agg_sales summary table (see MIlestone_2/sales_aggregates.py)
+SELECT
+    year,
+    month,
+    ROUND(SUM(total_sales)::NUMERIC, 2) AS total_sales
+FROM agg_sales
+GROUP BY year, month
+ORDER BY total_sales DESC
+LIMIT 10;
@@ -0,0 +1,9 @@
+-- Task 8 answered from the agg_sales summary table (see MIlestone_2/sales_aggregates.py)
+SELECT
+    ROUND(SUM(total_sales)::numeric, 2) AS total_sales,
+    store_type,
+    country_code
+FROM agg_sales
+WHERE country_code = 'DE'
+GROUP BY store_type, country_code
+ORDER BY total_sales DESC;
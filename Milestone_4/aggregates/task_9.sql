@@ -0,0 +1,36 @@
+-- Task 9 answered from the agg_sale_times summary table (see MIlestone_2/sales_aggregates.py)
+
+-- Step 1: Find the last sale before each year's first sale
+WITH years AS (
+    SELECT
+        year,
+        number_of_sales,
+        first_sale,
+        last_sale,
+        LAG(last_sale) OVER (ORDER BY first_sale) AS previous_sale
+    FROM agg_sale_times
+    WHERE number_of_sales > 0
+),
+
+-- Step 2: The gaps between consecutive sales of a year add up to its last sale minus the sale before it;
+-- the first year has no sale before it, so its gaps start at its own first sale
+avg_times AS (
+    SELECT
+        year,
+        EXTRACT(EPOCH FROM (last_sale - COALESCE(previous_sale, first_sale)))
+            / NULLIF(number_of_sales - CASE WHEN previous_sale IS NULL THEN 1 ELSE 0 END, 0) AS avg_times_seconds
+    FROM years
+)
+
+-- Step 3: Format the average time difference into hours, minutes, seconds, and milliseconds
+SELECT
+    year,
+    CONCAT(
+        '"Hours": ', FLOOR(avg_times_seconds / 3600), ', ',
+        '"Minutes": ', FLOOR((avg_times_seconds % 3600) / 60), ', ',
+        '"Seconds": ', FLOOR(avg_times_seconds % 60), ', ',
+        '"Milliseconds": ', FLOOR((avg_times_seconds - FLOOR(avg_times_seconds)) * 1000)
+    ) AS actual_time_taken
+FROM avg_times
+ORDER BY avg_times_seconds DESC
+LIMIT 5;